@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Radicale Server - Calendar Server
+# Copyright © 2011 Guillaume Ayoub
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Radicale benchmarks.
+
+Shared tools of the benchmark scripts: synthetic calendars, measures,
+reports and baselines.
+
+The scripts are launched from the root of the source tree, for example::
+
+    python -m benchmarks.handlers --sizes 10,1000
+
+"""
+
+from datetime import datetime, timedelta
+import json
+import optparse
+import sys
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+# Dates of the synthetic events are spread from this date
+EPOCH = datetime(2011, 1, 3, 8)
+
+# Duration covered by the synthetic events
+SPAN = timedelta(days=365)
+
+DATE_FORMAT = "%Y%m%dT%H%M%SZ"
+LOCAL_DATE_FORMAT = "%Y%m%dT%H%M%S"
+
+EVENT = """BEGIN:VEVENT
+UID:%(uid)s
+DTSTAMP:20110101T000000Z
+%(recurrence_id)sDTSTART%(dtstart)s
+DTEND%(dtend)s
+%(rrule)sSUMMARY:%(summary)s
+DESCRIPTION:Synthetic event used by the Radicale benchmarks
+END:VEVENT"""
+
+CALENDAR = """BEGIN:VCALENDAR
+PRODID:-//Radicale//NONSGML Radicale Benchmarks//EN
+VERSION:2.0
+%s
+END:VCALENDAR
+"""
+
+
+def event_dtstart(index, size):
+    """Return the start date of the event ``index`` out of ``size``."""
+    return EPOCH + timedelta(seconds=int(
+        SPAN.total_seconds() * index / max(size, 1)))
+
+
+def _date(date, tzid=None):
+    """Return the parameters and value of a date property."""
+    if tzid:
+        return ";TZID=%s:%s" % (tzid, date.strftime(LOCAL_DATE_FORMAT))
+    return ":%s" % date.strftime(DATE_FORMAT)
+
+
+def event(uid, dtstart, duration=timedelta(hours=1), rrule=None, tzid=None,
+          recurrence_id=None, summary=None):
+    """Return the text of a VEVENT component.
+
+    Dates are in UTC, or local times in the ``tzid`` timezone. If
+    ``recurrence_id`` is given, the event overrides this occurrence of the
+    recurring event with the same ``uid``.
+
+    """
+    return EVENT % {
+        "uid": uid,
+        "recurrence_id": "RECURRENCE-ID%s\n" % _date(
+            recurrence_id, tzid) if recurrence_id else "",
+        "dtstart": _date(dtstart, tzid),
+        "dtend": _date(dtstart + duration, tzid),
+        "rrule": "RRULE:%s\n" % rrule if rrule else "",
+        "summary": summary or "Event %s" % uid}
+
+
+def calendar(components):
+    """Return the text of a VCALENDAR including the ``components`` texts."""
+    return CALENDAR % "\n".join(components)
+
+
+def percentile(values, fraction):
+    """Return the ``fraction`` percentile of the sorted ``values``."""
+    if not values:
+        return 0
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def measure(function, repeat, budget):
+    """Call ``function`` up to ``repeat`` times, return the durations.
+
+    Calls stop when ``budget`` seconds are spent, ``function`` is always
+    called at least once.
+
+    """
+    durations = []
+    total = 0
+    while len(durations) < repeat and (not durations or total < budget):
+        start = timeit.default_timer()
+        function()
+        durations.append(timeit.default_timer() - start)
+        total += durations[-1]
+    return durations
+
+
+def peak_memory(function):
+    """Call ``function``, return the peak of its memory allocations in bytes.
+
+    Return ``None`` if memory allocations cannot be traced.
+
+    """
+    if tracemalloc is None:
+        function()
+        return None
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def summarize(durations, memory=None, operations=1):
+    """Return the throughput, latency percentiles and memory of a run.
+
+    ``operations`` is the number of operations done by each run.
+
+    """
+    durations = sorted(durations)
+    return {
+        "runs": len(durations),
+        "throughput": operations * len(durations) / (sum(durations) or 1e-9),
+        "p50": percentile(durations, 0.5),
+        "p99": percentile(durations, 0.99),
+        "memory": memory}
+
+
+def print_header(stream=sys.stdout):
+    """Print the titles of the columns of ``print_result``."""
+    stream.write("%-40s %6s %10s %10s %10s %10s\n" % (
+        "benchmark", "runs", "ops/s", "p50 ms", "p99 ms", "peak KiB"))
+
+
+def print_result(name, result, stream=sys.stdout):
+    """Print the ``result`` of the benchmark called ``name``."""
+    memory = result.get("memory")
+    stream.write("%-40s %6i %10.1f %10.2f %10.2f %10s\n" % (
+        name, result["runs"], result["throughput"], result["p50"] * 1000,
+        result["p99"] * 1000, "-" if memory is None else memory // 1024))
+    stream.flush()
+
+
+def save_baseline(path, results):
+    """Save ``results`` as a baseline in the JSON file at ``path``."""
+    with open(path, "w") as stream:
+        json.dump(results, stream, indent=2, sort_keys=True)
+
+
+def compare(path, results, threshold):
+    """Compare ``results`` with the baseline saved at ``path``.
+
+    Return the list of the regressions, as printable lines. The median
+    latency and the peak memory of a benchmark regress when they grow by more
+    than the ``threshold`` fraction.
+
+    """
+    with open(path) as stream:
+        baseline = json.load(stream)
+
+    # Compared values, with their unit and the factor to convert them
+    keys = (("p50", "ms", 1000), ("memory", "KiB", 1 / 1024.))
+
+    regressions = []
+    for name, result in sorted(results.items()):
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        for key, unit, factor in keys:
+            old, new = reference.get(key), result.get(key)
+            if old and new and new > old * (1 + threshold):
+                regressions.append("%s: %s %.2f%s -> %.2f%s (+%i%%)" % (
+                    name, key, old * factor, unit, new * factor, unit,
+                    100 * (new - old) / old))
+    return regressions
+
+
+def option_parser(module):
+    """Return a parser of the options shared by the benchmark ``module``."""
+    parser = optparse.OptionParser(usage="python -m %s [options]" % module)
+    parser.add_option(
+        "--repeat", type="int", default=20,
+        help="maximum number of runs per benchmark [%default]")
+    parser.add_option(
+        "--budget", type="float", default=10,
+        help="time budget per benchmark in seconds, at least one run is done "
+        "[%default]")
+    parser.add_option(
+        "--save", metavar="FILE", help="save the results as a baseline")
+    parser.add_option(
+        "--baseline", metavar="FILE",
+        help="compare the results with a baseline, fail on regressions")
+    parser.add_option(
+        "--threshold", type="float", default=0.2,
+        help="accepted growth of the baseline values, as a fraction "
+        "[%default]")
+    return parser
+
+
+def check(options, results):
+    """Save or compare ``results`` according to the command line options.
+
+    Exit with an error status if regressions are found.
+
+    """
+    if options.save:
+        save_baseline(options.save, results)
+    if options.baseline:
+        regressions = compare(options.baseline, results, options.threshold)
+        for regression in regressions:
+            sys.stdout.write("Regression: %s\n" % regression)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Radicale Server - Calendar Server
+# Copyright © 2011 Guillaume Ayoub
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Radicale synthetic dataset generator.
+
+Write calendars of synthetic users in a storage folder. The same seed always
+gives the same calendars, so that load tests can be reproduced.
+
+Run ``python -m benchmarks.dataset --help`` for the options.
+
+"""
+
+import optparse
+import os
+import random
+import sys
+from datetime import timedelta
+
+from radicale import ical
+
+import benchmarks
+
+
+# Timezones used by the events with local times
+TIMEZONES = {
+    "Europe/Paris": ("+0100", "+0200", "-1SU", 10, "-1SU", 3),
+    "America/New_York": ("-0500", "-0400", "1SU", 11, "2SU", 3),
+    "Australia/Sydney": ("+1000", "+1100", "1SU", 4, "1SU", 10),
+    "Asia/Tokyo": ("+0900", None, None, None, None, None)}
+
+TIMEZONE = """BEGIN:VTIMEZONE
+TZID:%(tzid)s
+BEGIN:STANDARD
+DTSTART:19700101T030000
+%(standard_rrule)sTZOFFSETFROM:%(daylight)s
+TZOFFSETTO:%(standard)s
+END:STANDARD
+%(daylight_component)sEND:VTIMEZONE"""
+
+DAYLIGHT = """BEGIN:DAYLIGHT
+DTSTART:19700101T020000
+RRULE:FREQ=YEARLY;BYDAY=%s;BYMONTH=%i
+TZOFFSETFROM:%s
+TZOFFSETTO:%s
+END:DAYLIGHT
+"""
+
+# Recurrence rules of the recurring events
+RRULES = (
+    "FREQ=DAILY;COUNT=30",
+    "FREQ=WEEKLY;COUNT=52",
+    "FREQ=WEEKLY;INTERVAL=2;COUNT=26",
+    "FREQ=MONTHLY;COUNT=12")
+
+# Intervals between the occurrences of ``RRULES``
+INTERVALS = (
+    timedelta(days=1), timedelta(weeks=1), timedelta(weeks=2),
+    timedelta(days=28))
+
+DURATIONS = (
+    timedelta(minutes=30), timedelta(hours=1), timedelta(hours=2),
+    timedelta(days=1))
+
+
+def user_name(index):
+    """Return the name of the synthetic user ``index``."""
+    return "user%i" % index
+
+
+def collection_name(index):
+    """Return the name of the synthetic collection ``index``."""
+    return "calendar%i" % index
+
+
+def timezone(tzid):
+    """Return the text of the VTIMEZONE component of ``tzid``."""
+    standard, daylight, standard_day, standard_month, daylight_day, \
+        daylight_month = TIMEZONES[tzid]
+    if daylight:
+        return TIMEZONE % {
+            "tzid": tzid,
+            "standard": standard,
+            "daylight": daylight,
+            "standard_rrule": "RRULE:FREQ=YEARLY;BYDAY=%s;BYMONTH=%i\n" % (
+                standard_day, standard_month),
+            "daylight_component": DAYLIGHT % (
+                daylight_day, daylight_month, standard, daylight)}
+    return TIMEZONE % {
+        "tzid": tzid, "standard": standard, "daylight": standard,
+        "standard_rrule": "", "daylight_component": ""}
+
+
+def collection(prefix, events, recurrence, timezones, overrides, rand):
+    """Return the text of a synthetic calendar.
+
+    ``prefix`` starts the UIDs of the events. ``recurrence`` is the ratio of
+    recurring events, ``overrides`` the ratio of recurring events with an
+    overridden occurrence. Events with local times use the ``timezones``.
+
+    """
+    components = [timezone(tzid) for tzid in timezones]
+    for i in range(events):
+        uid = "%s-%i" % (prefix, i)
+        dtstart = benchmarks.event_dtstart(i, events).replace(
+            hour=rand.randint(7, 19), minute=rand.choice((0, 15, 30, 45)))
+        duration = rand.choice(DURATIONS)
+        tzid = rand.choice(timezones) if timezones else None
+        if rand.random() < recurrence:
+            rule = rand.randrange(len(RRULES))
+            components.append(benchmarks.event(
+                uid, dtstart, duration, RRULES[rule], tzid))
+            if rand.random() < overrides:
+                # Move the third occurrence one hour later
+                occurrence = dtstart + 2 * INTERVALS[rule]
+                components.append(benchmarks.event(
+                    uid, occurrence + timedelta(hours=1), duration, None,
+                    tzid, occurrence, "Moved event %s" % uid))
+        else:
+            components.append(benchmarks.event(
+                uid, dtstart, duration, tzid=tzid))
+    return benchmarks.calendar(components)
+
+
+def generate(folder, users, collections, events, recurrence=0.2,
+             timezones=1, overrides=0.1, seed=0):
+    """Write the synthetic calendars in ``folder``.
+
+    Return the number of written events, overrides excluded.
+
+    """
+    rand = random.Random(seed)
+    tzids = sorted(TIMEZONES)[:timezones]
+    for user in range(users):
+        user_folder = os.path.join(folder, user_name(user))
+        if not os.path.isdir(user_folder):
+            os.makedirs(user_folder)
+        for index in range(collections):
+            prefix = "%s-%s" % (user_name(user), collection_name(index))
+            with ical.open(os.path.join(
+                    user_folder, collection_name(index)), "w") as stream:
+                stream.write(collection(
+                    prefix, events, recurrence, tzids, overrides, rand))
+    return users * collections * events
+
+
+def main():
+    """Parse the command line and generate the dataset."""
+    parser = optparse.OptionParser(
+        usage="python -m benchmarks.dataset [options]")
+    parser.add_option(
+        "--folder", default=ical.FOLDER,
+        help="storage folder [%default]")
+    parser.add_option(
+        "--users", type="int", default=10, help="number of users [%default]")
+    parser.add_option(
+        "--collections", type="int", default=2,
+        help="number of calendars per user [%default]")
+    parser.add_option(
+        "--events", type="int", default=500,
+        help="number of events per calendar [%default]")
+    parser.add_option(
+        "--recurrence", type="float", default=0.2,
+        help="ratio of recurring events [%default]")
+    parser.add_option(
+        "--timezones", type="int", default=1,
+        help="number of timezones used by local times, 0 for UTC only, "
+        "at most %i [%%default]" % len(TIMEZONES))
+    parser.add_option(
+        "--overrides", type="float", default=0.1,
+        help="ratio of recurring events with an overridden occurrence "
+        "[%default]")
+    parser.add_option(
+        "--seed", type="int", default=0, help="random seed [%default]")
+    options = parser.parse_args()[0]
+
+    count = generate(
+        os.path.expanduser(options.folder), options.users,
+        options.collections, options.events, options.recurrence,
+        options.timezones, options.overrides, options.seed)
+    sys.stdout.write("%i events written in %s\n" % (count, options.folder))
+
+
+if __name__ == "__main__":
+    main()
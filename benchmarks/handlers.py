@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Radicale Server - Calendar Server
+# Copyright © 2011 Guillaume Ayoub
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Radicale request handlers benchmark.
+
+Call the WSGI application in process with synthetic requests, on calendars
+of different sizes stored in a temporary folder. Each scenario is measured
+on calendars with simple events, and on calendars with recurring events.
+
+Run ``python -m benchmarks.handlers --help`` for the options.
+
+"""
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+from datetime import timedelta
+
+import radicale
+from radicale import ical
+
+import benchmarks
+
+
+USER = "bench"
+CALENDAR = "calendar"
+
+# Recurrence rule of the recurring events
+RRULE = "FREQ=WEEKLY;COUNT=10"
+
+# Number of items requested by the multiget scenario
+MULTIGET_ITEMS = 10
+
+# Approximate number of events returned by the time-range queries
+QUERY_EVENTS = 20
+
+PROPFIND = """<?xml version="1.0" encoding="utf-8"?>
+<D:propfind xmlns:D="DAV:" xmlns:CS="http://calendarserver.org/ns/">
+  <D:prop>
+    <D:resourcetype/>
+    <D:displayname/>
+    <D:getetag/>
+    <CS:getctag/>
+  </D:prop>
+</D:propfind>"""
+
+QUERY = """<?xml version="1.0" encoding="utf-8"?>
+<C:calendar-query xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
+  <D:prop>
+    <D:getetag/>
+    %s
+  </D:prop>
+  <C:filter>
+    <C:comp-filter name="VCALENDAR">
+      <C:comp-filter name="VEVENT">
+        <C:time-range start="%s" end="%s"/>
+      </C:comp-filter>
+    </C:comp-filter>
+  </C:filter>
+</C:calendar-query>"""
+
+EXPAND = """<C:calendar-data>
+      <C:expand start="%s" end="%s"/>
+    </C:calendar-data>"""
+
+MULTIGET = """<?xml version="1.0" encoding="utf-8"?>
+<C:calendar-multiget xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
+  <D:prop>
+    <D:getetag/>
+    <C:calendar-data/>
+  </D:prop>
+  %s
+</C:calendar-multiget>"""
+
+
+def start_response(status, headers, exc_info=None):
+    """Check the response status."""
+    if int(status.split()[0]) >= 400:
+        raise RuntimeError("Request failed: %s" % status)
+
+
+def request(application, method, path, body="", **headers):
+    """Call ``application`` with a synthetic request, return the answer."""
+    body = body.encode("utf-8")
+    environ = {
+        "REQUEST_METHOD": method,
+        "PATH_INFO": path,
+        "CONTENT_LENGTH": str(len(body)),
+        "CONTENT_TYPE": "text/xml; charset=utf-8",
+        "REMOTE_ADDR": "127.0.0.1",
+        "wsgi.input": io.BytesIO(body)}
+    for key, value in headers.items():
+        environ["HTTP_%s" % key.upper()] = value
+    return b"".join(application(environ, start_response))
+
+
+def create_calendar(size, recurrence):
+    """Write a calendar of ``size`` events in the storage folder."""
+    path = os.path.join(ical.FOLDER, USER, CALENDAR)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with ical.open(path, "w") as stream:
+        stream.write(benchmarks.calendar(
+            benchmarks.event(
+                "event-%i" % i, benchmarks.event_dtstart(i, size),
+                rrule=RRULE if recurrence else None)
+            for i in range(size)))
+
+
+def scenarios(application, size):
+    """Return the list of ``(name, function)`` benchmark scenarios."""
+    calendar_path = "/%s/%s/" % (USER, CALENDAR)
+    item_path = "%sevent-%i" % (calendar_path, size // 2)
+
+    # The time range selects about QUERY_EVENTS events in the middle
+    start = benchmarks.event_dtstart(size // 2, size)
+    end = start + timedelta(seconds=max(
+        3600, benchmarks.SPAN.total_seconds() * QUERY_EVENTS / size))
+    start, end = (date.strftime(benchmarks.DATE_FORMAT) for date in (
+        start, end))
+
+    hrefs = "\n  ".join(
+        "<D:href>%sevent-%i</D:href>" % (
+            calendar_path, i * size // MULTIGET_ITEMS)
+        for i in range(min(size, MULTIGET_ITEMS)))
+
+    counter = iter(range(sys.maxsize))
+
+    def put():
+        """Add a new event."""
+        uid = "new-%i" % next(counter)
+        request(
+            application, "PUT", "%s%s.ics" % (calendar_path, uid),
+            benchmarks.calendar([benchmarks.event(
+                uid, benchmarks.EPOCH)]))
+
+    return [
+        ("GET item", lambda: request(application, "GET", item_path)),
+        ("GET calendar", lambda: request(application, "GET", calendar_path)),
+        ("PROPFIND depth 0", lambda: request(
+            application, "PROPFIND", calendar_path, PROPFIND, depth="0")),
+        ("PROPFIND depth 1", lambda: request(
+            application, "PROPFIND", calendar_path, PROPFIND, depth="1")),
+        ("REPORT time-range", lambda: request(
+            application, "REPORT", calendar_path, QUERY % ("", start, end),
+            depth="1")),
+        ("REPORT expand", lambda: request(
+            application, "REPORT", calendar_path,
+            QUERY % (EXPAND % (start, end), start, end), depth="1")),
+        ("REPORT multiget", lambda: request(
+            application, "REPORT", calendar_path, MULTIGET % hrefs,
+            depth="1")),
+        # PUT is the last scenario, as it changes the calendar
+        ("PUT", put)]
+
+
+def run(sizes, repeat, budget, memory=True, response_cache=False,
+        stream=sys.stdout):
+    """Run the benchmarks, return a dict of results.
+
+    Answers are computed for each request, unless ``response_cache`` is
+    ``True``.
+
+    """
+    application = radicale.Application()
+    if not response_cache:
+        application.responses.size = 0
+    results = {}
+    benchmarks.print_header(stream)
+    for size in sizes:
+        for recurrence in (False, True):
+            create_calendar(size, recurrence)
+            for scenario, function in scenarios(application, size):
+                name = "%s %i%s" % (
+                    scenario, size, " recurring" if recurrence else "")
+                durations = benchmarks.measure(function, repeat, budget)
+                peak = benchmarks.peak_memory(function) if memory else None
+                results[name] = benchmarks.summarize(durations, peak)
+                benchmarks.print_result(name, results[name], stream)
+    return results
+
+
+def main():
+    """Parse the command line, run the benchmarks and compare the results."""
+    parser = benchmarks.option_parser("benchmarks.handlers")
+    parser.add_option(
+        "--sizes", default="10,100,1000,10000,50000",
+        help="comma-separated numbers of events per calendar")
+    parser.add_option(
+        "--no-memory", action="store_false", dest="memory", default=True,
+        help="do not measure the peak memory, which needs an extra run")
+    parser.add_option(
+        "--response-cache", action="store_true", default=False,
+        help="keep the response cache enabled, repeated requests are then "
+        "answered from memory")
+    options = parser.parse_args()[0]
+
+    sizes = [int(size) for size in options.sizes.split(",")]
+    ical.FOLDER = tempfile.mkdtemp(prefix="radicale-benchmarks-")
+    try:
+        results = run(
+            sizes, options.repeat, options.budget, options.memory,
+            options.response_cache)
+    finally:
+        shutil.rmtree(ical.FOLDER)
+    benchmarks.check(options, results)
+
+if __name__ == "__main__":
+    main()
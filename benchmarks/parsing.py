@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Radicale Server - Calendar Server
+# Copyright © 2011 Guillaume Ayoub
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Radicale iCal parsing micro-benchmarks.
+
+Measure the primitives of the ``ical`` module on synthetic calendars: line
+unfolding, item creation, date parsing, serialization and whole calendar
+parsing. Throughputs are given in components, or dates, per second.
+
+Run ``python -m benchmarks.parsing --help`` for the options.
+
+"""
+
+from radicale import ical
+
+import benchmarks
+
+
+# Long description, folded as required by rfc5545-3.1
+DESCRIPTION = "DESCRIPTION:%s" % " ".join(
+    ["Synthetic event used by the Radicale benchmarks."] * 4)
+
+
+def fold(line, length=75):
+    """Fold ``line`` into lines of ``length`` characters at most."""
+    parts = [line[:length]]
+    for i in range(length, len(line), length - 1):
+        parts.append(" " + line[i:i + length - 1])
+    return "\n".join(parts)
+
+
+def components(size):
+    """Return the texts of ``size`` VEVENT components, half of them recurring.
+
+    Components have a long folded description.
+
+    """
+    folded = fold(DESCRIPTION)
+    return [
+        benchmarks.event(
+            "event-%i" % i, benchmarks.event_dtstart(i, size),
+            rrule="FREQ=WEEKLY;COUNT=10" if i % 2 else None).replace(
+                "DESCRIPTION:Synthetic event used by the Radicale benchmarks",
+                folded)
+        for i in range(size)]
+
+
+def scenarios(size):
+    """Return the list of ``(name, function, operations)`` scenarios."""
+    texts = components(size)
+    text = benchmarks.calendar(texts)
+    items = [ical.Event(item_text) for item_text in texts]
+    headers = [
+        ical.Header("PRODID:-//Radicale//NONSGML Radicale Benchmarks//EN"),
+        ical.Header("VERSION:2.0")]
+    dates = [
+        line.split(":", 1)[1] for item_text in texts
+        for line in item_text.splitlines()
+        if line.startswith("DTSTART") or line.startswith("DTEND")]
+    item_types = (ical.Event, ical.Todo, ical.Journal, ical.Timezone)
+
+    return [
+        ("unfold", lambda: ical.unfold(text), size),
+        ("Item", lambda: [ical.Event(item_text) for item_text in texts],
+         size),
+        ("Item named", lambda: [
+            ical.Event(item_text, "named.ics") for item_text in texts], size),
+        ("date", lambda: [ical.parse_date(date) for date in dates],
+         len(dates)),
+        ("properties", lambda: [
+            ical.Event(item.text).get("SUMMARY") for item in items], size),
+        ("serialize", lambda: ical.serialize(headers, items), size),
+        ("parse calendar", lambda: ical.Calendar._parse_items(
+            text, item_types), size)]
+
+
+def main():
+    """Parse the command line, run the benchmarks and compare the results."""
+    parser = benchmarks.option_parser("benchmarks.parsing")
+    parser.add_option(
+        "--sizes", default="1000,50000",
+        help="comma-separated numbers of events per calendar [%default]")
+    options = parser.parse_args()[0]
+
+    results = {}
+    benchmarks.print_header()
+    for size in [int(size) for size in options.sizes.split(",")]:
+        for scenario, function, operations in scenarios(size):
+            name = "%s %i" % (scenario, size)
+            durations = benchmarks.measure(
+                function, options.repeat, options.budget)
+            results[name] = benchmarks.summarize(
+                durations, benchmarks.peak_memory(function), operations)
+            benchmarks.print_result(name, results[name])
+    benchmarks.check(options, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Radicale Server - Calendar Server
+# Copyright © 2011 Guillaume Ayoub
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Radicale client sessions replay.
+
+Virtual clients replay synchronization sessions against a running server,
+using the calendars written by ``benchmarks.dataset``. Each session
+discovers the calendars of a user, polls the ctag of one of them, queries
+its events, gets some of them with a multiget and updates one with a PUT.
+
+Latency percentiles and error rates are reported for each step.
+
+Run ``python -m benchmarks.replay --help`` for the options.
+
+"""
+
+import base64
+import optparse
+import random
+import re
+import sys
+import threading
+import timeit
+from datetime import timedelta
+# Manage Python2/3 different modules
+# pylint: disable=F0401
+try:
+    from http import client
+    from urllib.parse import urlparse
+except ImportError:
+    import httplib as client
+    from urlparse import urlparse
+# pylint: enable=F0401
+
+import benchmarks
+from benchmarks import dataset
+from benchmarks.handlers import MULTIGET, PROPFIND, QUERY
+
+
+STEPS = ("discovery", "ctag", "query", "multiget", "put")
+
+# Number of items requested by the multiget step
+MULTIGET_ITEMS = 10
+
+# Duration of the time ranges queried by the clients
+QUERY_RANGE = timedelta(days=31)
+
+HREF_REGEX = re.compile(r"<(?:\w+:)?href>([^<]*)</(?:\w+:)?href>")
+
+
+class Statistics(object):
+    """Durations and errors of the steps, shared by the clients."""
+    def __init__(self):
+        """Initialize empty statistics."""
+        self._lock = threading.Lock()
+        self.durations = dict((step, []) for step in STEPS)
+        self.errors = dict((step, 0) for step in STEPS)
+
+    def record(self, step, duration, error):
+        """Record the ``duration`` of a ``step``, and if it failed."""
+        with self._lock:
+            self.durations[step].append(duration)
+            if error:
+                self.errors[step] += 1
+
+
+class Client(threading.Thread):
+    """Virtual client replaying sessions on a persistent connection."""
+    def __init__(self, url, users, sessions, statistics, seed, password=None):
+        """Initialize the client with a connection to ``url``."""
+        super(Client, self).__init__()
+        self.daemon = True
+        parts = urlparse(url)
+        connection_class = (
+            client.HTTPSConnection if parts.scheme == "https"
+            else client.HTTPConnection)
+        self.connection = connection_class(parts.hostname, parts.port)
+        self.root = parts.path.rstrip("/")
+        self.users = users
+        self.sessions = sessions
+        self.statistics = statistics
+        self.random = random.Random(seed)
+        self.password = password
+
+    def request(self, step, method, path, body="", **headers):
+        """Send a request, record its duration, return status and answer."""
+        headers = dict(
+            (key.replace("_", "-"), value) for key, value in headers.items())
+        headers["Content-Type"] = "text/xml; charset=utf-8"
+        if self.password is not None:
+            credentials = "%s:%s" % (path.split("/")[1], self.password)
+            headers["Authorization"] = "Basic %s" % base64.b64encode(
+                credentials.encode("utf-8")).decode("ascii")
+        start = timeit.default_timer()
+        try:
+            self.connection.request(
+                method, self.root + path, body.encode("utf-8"), headers)
+            response = self.connection.getresponse()
+            answer = response.read().decode("utf-8", "replace")
+            status = response.status
+        except (client.HTTPException, IOError):
+            self.connection.close()
+            status, answer = None, ""
+        self.statistics.record(
+            step, timeit.default_timer() - start,
+            status is None or status >= 400)
+        return status, answer
+
+    def session(self):
+        """Replay a synchronization session."""
+        user = dataset.user_name(self.random.randrange(self.users))
+        status, answer = self.request(
+            "discovery", "PROPFIND", "/%s/" % user, PROPFIND, depth="1")
+        calendars = [
+            href for href in HREF_REGEX.findall(answer)
+            if href.rstrip("/") != "/%s" % user]
+        if not calendars:
+            return
+        calendar = self.random.choice(calendars)
+        calendar = "/%s/" % calendar.strip("/")
+
+        self.request("ctag", "PROPFIND", calendar, PROPFIND, depth="0")
+
+        start = benchmarks.EPOCH + timedelta(
+            days=self.random.randrange(benchmarks.SPAN.days))
+        status, answer = self.request(
+            "query", "REPORT", calendar, QUERY % (
+                "", start.strftime(benchmarks.DATE_FORMAT),
+                (start + QUERY_RANGE).strftime(benchmarks.DATE_FORMAT)),
+            depth="1")
+        items = [
+            href for href in HREF_REGEX.findall(answer)
+            if href.rstrip("/") != calendar.rstrip("/")]
+        if not items:
+            return
+        hrefs = self.random.sample(items, min(len(items), MULTIGET_ITEMS))
+        self.request(
+            "multiget", "REPORT", calendar, MULTIGET % "\n  ".join(
+                "<D:href>%s</D:href>" % href for href in hrefs), depth="1")
+
+        # Replace an event by a new version of itself
+        href = self.random.choice(hrefs)
+        uid = href.rstrip("/").rsplit("/", 1)[-1]
+        self.request(
+            "put", "PUT", "%s%s" % (calendar, uid), benchmarks.calendar([
+                benchmarks.event(uid, start, summary="Updated %s" % uid)]))
+
+    def run(self):
+        """Replay the sessions."""
+        try:
+            for _ in range(self.sessions):
+                self.session()
+        finally:
+            self.connection.close()
+
+
+def report(statistics, duration, stream=sys.stdout):
+    """Print the latency percentiles and error rates of each step."""
+    stream.write("%-10s %8s %8s %10s %10s %10s %10s\n" % (
+        "step", "requests", "errors", "p50 ms", "p90 ms", "p99 ms",
+        "max ms"))
+    total = 0
+    for step in STEPS:
+        durations = sorted(statistics.durations[step])
+        total += len(durations)
+        errors = statistics.errors[step]
+        stream.write("%-10s %8i %7.1f%% %10.2f %10.2f %10.2f %10.2f\n" % (
+            step, len(durations),
+            100. * errors / len(durations) if durations else 0,
+            benchmarks.percentile(durations, 0.5) * 1000,
+            benchmarks.percentile(durations, 0.9) * 1000,
+            benchmarks.percentile(durations, 0.99) * 1000,
+            (durations[-1] if durations else 0) * 1000))
+    stream.write("%i requests in %.1fs, %.1f requests/s\n" % (
+        total, duration, total / (duration or 1e-9)))
+
+
+def main():
+    """Parse the command line, replay the sessions and print the report."""
+    parser = optparse.OptionParser(
+        usage="python -m benchmarks.replay [options]")
+    parser.add_option(
+        "--url", default="http://localhost:5232/",
+        help="root URL of the server [%default]")
+    parser.add_option(
+        "--clients", type="int", default=10,
+        help="number of concurrent virtual clients [%default]")
+    parser.add_option(
+        "--sessions", type="int", default=20,
+        help="number of sessions per client [%default]")
+    parser.add_option(
+        "--users", type="int", default=10,
+        help="number of users in the dataset [%default]")
+    parser.add_option(
+        "--password",
+        help="password of the users, sent with their names if set")
+    parser.add_option(
+        "--seed", type="int", default=0, help="random seed [%default]")
+    options = parser.parse_args()[0]
+
+    statistics = Statistics()
+    clients = [
+        Client(options.url, options.users, options.sessions, statistics,
+               options.seed + i, options.password)
+        for i in range(options.clients)]
+    start = timeit.default_timer()
+    for virtual_client in clients:
+        virtual_client.start()
+    for virtual_client in clients:
+        virtual_client.join()
+    report(statistics, timeit.default_timer() - start)
+
+    if any(statistics.errors.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
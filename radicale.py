@@ -33,11 +33,13 @@ Launch the server according to configuration and command-line options.
 """
 
 import atexit
+import errno
 import os
 import sys
 import optparse
 import signal
 import threading
+import time
 from wsgiref.simple_server import make_server
 
 import radicale
@@ -52,6 +54,14 @@ parser.add_option(
     "-p", "--pid",
     default=radicale.config.get("server", "pid"),
     help="set PID filename for daemon mode")
+parser.add_option(
+    "-w", "--workers", type="int",
+    default=radicale.config.getint("server", "workers"),
+    help="set number of worker processes")
+parser.add_option(
+    "-F", "--frontend", type="choice", choices=("threads", "asyncio"),
+    default=radicale.config.get("server", "frontend"),
+    help="set connection handling front end (threads or asyncio)")
 parser.add_option(
     "-f", "--foreground", action="store_false", dest="daemon",
     help="launch in foreground (opposite of --daemon)")
@@ -118,53 +128,245 @@ server_class = radicale.HTTPSServer if options.ssl else radicale.HTTPServer
 shutdown_program = threading.Event()
 
 for host in options.hosts.split(','):
-    address, port = host.strip().rsplit(':', 1)
-    address, port = address.strip('[] '), int(port)
-    servers.append(
-        make_server(address, port, radicale.Application(),
-                    server_class, radicale.RequestHandler))
+    host = host.strip()
+    # Unix domain sockets are used by local reverse proxies, without SSL
+    unix_socket = host.startswith("unix:")
+    if unix_socket:
+        address = host[len("unix:"):]
+    else:
+        address, port = host.rsplit(':', 1)
+        address = (address.strip('[] '), int(port))
+    if options.frontend == "asyncio":
+        from radicale import aio
+        servers.append(aio.AsyncServer(
+            address, radicale.Application(), options.ssl and not unix_socket))
+    elif unix_socket:
+        server = radicale.UnixHTTPServer(address, radicale.RequestHandler)
+        server.set_app(radicale.Application())
+        servers.append(server)
+    else:
+        servers.append(
+            make_server(address[0], address[1], radicale.Application(),
+                        server_class, radicale.RequestHandler))
 
 # SIGTERM and SIGINT (aka KeyboardInterrupt) should just mark this for shutdown
 signal.signal(signal.SIGTERM, lambda *_: shutdown_program.set())
 signal.signal(signal.SIGINT, lambda *_: shutdown_program.set())
 
-def serve_forever(server):
-    """Serve a server forever, cleanly shutdown when things go wrong."""
-    try:
-        server.serve_forever()
-    finally:
-        shutdown_program.set()
 
-# Start the servers in a different loop to avoid possible race-conditions, when
-# a server exists but another server is added to the list at the same time
-for server in servers:
-    radicale.log.LOGGER.debug(
-        "Listening to %s port %s" % (server.server_name, server.server_port))
+def reload_certificates(*_):
+    """Reload the SSL certificate and key of the servers."""
     if options.ssl:
-        radicale.log.LOGGER.debug("Using SSL")
-    threading.Thread(target=serve_forever, args=(server,)).start()
+        radicale.log.LOGGER.info("Reloading SSL certificate and key")
+        for server in servers:
+            try:
+                server.reload_certificate()
+            except (IOError, OSError) as exception:
+                radicale.log.LOGGER.error(
+                    "Error while reloading SSL files: %s" % exception)
 
-radicale.log.LOGGER.debug("Radicale server ready")
+# SIGHUP reloads the SSL files, there is no SIGHUP on Windows
+if hasattr(signal, "SIGHUP"):
+    signal.signal(signal.SIGHUP, reload_certificates)
 
-# Main loop: wait until all servers are exited
-try:
+
+def wait_for_shutdown(timeout=5.0, callback=None):
+    """Wait until the program is marked for shutdown.
+
+    If ``callback`` is given, it is called each ``timeout`` seconds.
+
+    """
     # We must do the busy-waiting here, as all ``.join()`` calls completly
     # block the thread, such that signals are not received
     while True:
         # The number is irrelevant, it only needs to be greater than 0.05 due
         # to python implementing its own busy-waiting logic
-        shutdown_program.wait(5.0)
+        shutdown_program.wait(timeout)
         if shutdown_program.is_set():
             break
-finally:
-    # Ignore signals, so that they cannot interfere
-    signal.signal(signal.SIGINT, signal.SIG_IGN)
-    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        if callback:
+            callback()
+
 
-    radicale.log.LOGGER.info("Stopping Radicale")
+def server_address(server):
+    """Return a human-readable address of ``server``."""
+    if server.server_port:
+        return "%s port %s" % (server.server_name, server.server_port)
+    return server.server_name
 
+
+def serve_forever(server):
+    """Serve a server forever, cleanly shutdown when things go wrong."""
+    try:
+        server.serve_forever()
+    finally:
+        shutdown_program.set()
+
+
+def serve():
+    """Serve all the servers until the program is marked for shutdown."""
+    # Processes are forked before the threads are started
+    radicale.pool.start()
+
+    # Start the servers in a different loop to avoid possible race-conditions,
+    # when a server exists but another server is added to the list at the same
+    # time
     for server in servers:
-        radicale.log.LOGGER.debug(
-            "Closing server listening to %s port %s" % (
-                server.server_name, server.server_port))
-        server.shutdown()
+        radicale.log.LOGGER.debug("Listening to %s" % server_address(server))
+        if isinstance(server, radicale.HTTPSServer) or getattr(
+                server, "ssl_context", None) is not None:
+            radicale.log.LOGGER.debug("Using SSL")
+        threading.Thread(target=serve_forever, args=(server,)).start()
+
+    radicale.log.LOGGER.debug("Radicale server ready")
+
+    # Main loop: wait until all servers are exited
+    try:
+        wait_for_shutdown()
+    finally:
+        # Ignore signals, so that they cannot interfere
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+        radicale.log.LOGGER.info("Stopping Radicale")
+
+        # ``shutdown`` waits for the requests being processed to be answered
+        for server in servers:
+            radicale.log.LOGGER.debug(
+                "Closing server listening to %s" % server_address(server))
+            server.shutdown()
+            server.server_close()
+
+
+# Workers dying sooner after their start have failed to start, in seconds
+WORKER_MIN_UPTIME = 10
+# Maximum delay before restarting a worker that failed to start, in seconds
+WORKER_MAX_DELAY = 60
+# Number of successive failed starts stopping the supervisor
+WORKER_MAX_FAILURES = 5
+
+
+def start_worker(number):
+    """Fork a worker process serving the shared sockets, return its PID.
+
+    ``number`` labels the metrics of the worker.
+
+    """
+    pid = os.fork()
+    if pid:
+        radicale.log.LOGGER.debug("Worker %i started" % pid)
+        return pid
+
+    # Worker process, never go back to the supervisor code
+    radicale.metrics.WORKER = number
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, reload_certificates)
+    status = 0
+    try:
+        serve()
+    except BaseException:
+        radicale.log.LOGGER.exception("Worker %i crashed" % os.getpid())
+        status = 1
+    finally:
+        radicale.pool.stop()
+        radicale.log.stop()
+        # Skip the ``atexit`` functions, they belong to the supervisor
+        os._exit(status)  # pylint: disable=W0212
+
+
+def supervise():
+    """Start the workers, restart them when they die, stop them at exit."""
+    # Start times and numbers of the workers, by PID
+    workers = dict(
+        (start_worker(number), (time.time(), number))
+        for number in range(options.workers))
+    # Times when the dead workers are restarted, with their numbers
+    restarts = []
+    # Number of successive workers that died right after their start
+    failures = [0]
+
+    def reload_workers(*_):
+        """Ask the workers to reload the SSL files."""
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGHUP)
+            except OSError as exception:
+                # Worker already dead, not reaped yet
+                if exception.errno != errno.ESRCH:
+                    raise
+
+    # The SSL contexts are created before the workers are forked, the workers
+    # share the session ticket keys and can resume the sessions of each other
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, reload_workers)
+
+    def reap_workers():
+        """Restart the workers that have died.
+
+        Workers dying right after their start are restarted later and later,
+        the supervisor stops when they keep failing.
+
+        """
+        while workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if not pid:
+                break
+            if pid not in workers:
+                continue
+            started, number = workers.pop(pid)
+            if time.time() - started < WORKER_MIN_UPTIME:
+                failures[0] += 1
+            else:
+                failures[0] = 0
+            if failures[0] >= WORKER_MAX_FAILURES:
+                radicale.log.LOGGER.error(
+                    "Worker %i died with status %i, %i workers died right "
+                    "after their start, stopping" % (
+                        pid, status, failures[0]))
+                shutdown_program.set()
+                return
+            delay = min(2 ** failures[0] - 1, WORKER_MAX_DELAY)
+            radicale.log.LOGGER.warning(
+                "Worker %i died with status %i, restarting in %i seconds" % (
+                    pid, status, delay))
+            restarts.append((time.time() + delay, number))
+
+        now = time.time()
+        for restart in sorted(restarts):
+            if restart[0] > now:
+                break
+            restarts.remove(restart)
+            workers[start_worker(restart[1])] = (time.time(), restart[1])
+
+    radicale.log.LOGGER.debug("Radicale supervisor ready")
+
+    try:
+        wait_for_shutdown(1.0, reap_workers)
+    finally:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+        radicale.log.LOGGER.info("Stopping Radicale")
+
+        # Workers stop accepting connections, answer the requests being
+        # processed and exit
+        for pid in workers:
+            radicale.log.LOGGER.debug("Stopping worker %i" % pid)
+            os.kill(pid, signal.SIGTERM)
+        for pid in workers:
+            os.waitpid(pid, 0)
+
+        for server in servers:
+            radicale.log.LOGGER.debug(
+                "Closing server listening to %s" % server_address(server))
+            server.server_close()
+
+    if failures[0] >= WORKER_MAX_FAILURES:
+        sys.exit(1)
+
+
+# Launch the servers in this process, or in workers sharing the sockets
+if options.workers > 1:
+    supervise()
+else:
+    serve()
@@ -28,34 +28,118 @@ should have been included in this package.
 
 """
 
+import io
+import itertools
+import logging
 import os
 import pprint
 import base64
+import hashlib
 import posixpath
 import socket
 import ssl
+import stat
+import tempfile
+import threading
+import time
 import wsgiref.simple_server
+from contextlib import contextmanager
 # Manage Python2/3 different modules
 # pylint: disable=F0401,E0611
 try:
     from http import client
     from urllib.parse import quote, unquote, urlparse
+    import socketserver
 except ImportError:
     import httplib as client
     from urllib import quote, unquote
     from urlparse import urlparse
+    import SocketServer as socketserver
 # pylint: enable=F0401,E0611
 
-from radicale import acl, config, ical, log, xmlutils
+try:
+    import cProfile as profile
+except ImportError:
+    import profile
+
+from radicale import acl, cache, config, ical, log, metrics, timezones, \
+    xmlutils
 
 
 VERSION = "git"
 
+# Read-only methods whose concurrent identical requests are coalesced
+COALESCED_METHODS = ("GET", "HEAD", "REPORT")
+
+# Methods whose multistatus answers are cached
+CACHED_METHODS = ("PROPFIND", "REPORT")
+
+# Methods modifying the calendars, removing their cached answers
+WRITE_METHODS = ("DELETE", "MKCALENDAR", "MOVE", "PROPPATCH", "PUT")
+
+
+def ssl_context():
+    """Return an SSL context with the configured certificate and key.
+
+    The context is shared by all the connections of a server, returning
+    clients can then resume their sessions with session IDs or tickets.
+    Return ``None`` if SSL contexts are not supported.
+
+    """
+    if not hasattr(ssl, "SSLContext"):
+        return None
+    context = ssl.SSLContext(
+        getattr(ssl, "PROTOCOL_TLS_SERVER", ssl.PROTOCOL_SSLv23))
+    context.options &= ~getattr(ssl, "OP_NO_TICKET", 0)
+    load_certificate(context)
+    return context
+
+
+def load_certificate(context):
+    """Load the configured certificate and key in the SSL ``context``.
 
-class HTTPServer(wsgiref.simple_server.WSGIServer, object):
+    The context is kept, with its session cache and its session ticket keys.
+
+    """
+    context.load_cert_chain(
+        config.get("server", "certificate"), config.get("server", "key"))
+
+
+def bind_unix_socket(sock, path):
+    """Bind ``sock`` to the Unix domain socket ``path``.
+
+    A socket file left by a stopped server is removed, the permissions of the
+    new socket file are set according to the configuration.
+
+    """
+    if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except socket.error:
+            log.LOGGER.debug("Removing stale socket %s" % path)
+            os.unlink(path)
+        else:
+            raise socket.error("Socket %s already used" % path)
+        finally:
+            probe.close()
+    sock.bind(path)
+    os.chmod(path, int(config.get("server", "socket_mode"), 8))
+
+
+class HTTPServer(socketserver.ThreadingMixIn,
+                 wsgiref.simple_server.WSGIServer, object):
     """HTTP server."""
+    # Each connection is handled in its own thread, as keep-alive connections
+    # can stay idle between requests
+    daemon_threads = True
+
     def __init__(self, address, handler, bind_and_activate=True):
         """Create server."""
+        self.shutting_down = False
+        self._active_requests = 0
+        self._requests_condition = threading.Condition()
+
         ipv6 = ":" in address[0]
 
         if ipv6:
@@ -72,6 +156,30 @@ class HTTPServer(wsgiref.simple_server.WSGIServer, object):
             self.server_bind()
             self.server_activate()
 
+    @contextmanager
+    def processing_request(self):
+        """Mark a request as being processed during the ``with`` block."""
+        with self._requests_condition:
+            self._active_requests += 1
+        try:
+            yield
+        finally:
+            with self._requests_condition:
+                self._active_requests -= 1
+                self._requests_condition.notify_all()
+
+    def shutdown(self):
+        """Stop serving, wait until the current requests are answered.
+
+        Idle keep-alive connections are closed without waiting.
+
+        """
+        self.shutting_down = True
+        super(HTTPServer, self).shutdown()
+        with self._requests_condition:
+            while self._active_requests:
+                self._requests_condition.wait()
+
 
 class HTTPSServer(HTTPServer):
     """HTTPS server."""
@@ -89,22 +197,204 @@ class HTTPSServer(HTTPServer):
                     "Error while reading SSL %s %r: %s" % (
                         name, filename, exception))
 
-        self.socket = ssl.wrap_socket(
-            self.socket,
-            server_side=True,
-            certfile=config.get("server", "certificate"),
-            keyfile=config.get("server", "key"),
-            ssl_version=ssl.PROTOCOL_SSLv23)
+        self.ssl_context = ssl_context()
+        if self.ssl_context is None:
+            # No SSL context before Python 2.7.9 and 3.2, handshakes are done
+            # when connections are accepted
+            self.socket = ssl.wrap_socket(
+                self.socket,
+                server_side=True,
+                certfile=config.get("server", "certificate"),
+                keyfile=config.get("server", "key"),
+                ssl_version=ssl.PROTOCOL_SSLv23)
 
         self.server_bind()
         self.server_activate()
 
+    def reload_certificate(self):
+        """Use the current certificate and key for the new connections."""
+        if self.ssl_context is not None:
+            load_certificate(self.ssl_context)
+
+    def finish_request(self, request, client_address):
+        """Do the SSL handshake and answer the request.
+
+        This method is called in the connection thread, a slow handshake does
+        not block the other connections.
+
+        """
+        if self.ssl_context is None:
+            super(HTTPSServer, self).finish_request(request, client_address)
+            return
+
+        request.settimeout(self.RequestHandlerClass.timeout)
+        connection = self.ssl_context.wrap_socket(
+            request, server_side=True, do_handshake_on_connect=False)
+        try:
+            connection.do_handshake()
+            super(HTTPSServer, self).finish_request(connection, client_address)
+        except (ssl.SSLError, socket.error) as exception:
+            log.LOGGER.debug("SSL error with %s: %s" % (
+                client_address[0], exception))
+        finally:
+            self.shutdown_request(connection)
+
+
+class UnixHTTPServer(HTTPServer):
+    """HTTP server listening to a Unix domain socket."""
+    address_family = getattr(socket, "AF_UNIX", None)
+
+    def reload_certificate(self):
+        """Do nothing, Unix domain sockets do not use SSL."""
+
+    def server_bind(self):
+        """Bind the server to the socket file."""
+        self.owner_pid = os.getpid()
+        bind_unix_socket(self.socket, self.server_address)
+        self.server_name = self.server_address
+        self.server_port = 0
+        self.setup_environ()
+
+    def get_request(self):
+        """Accept a connection, Unix domain sockets have no client address."""
+        request, _ = self.socket.accept()
+        return request, ("", 0)
+
+    def server_close(self):
+        """Close the server and remove the socket file."""
+        super(UnixHTTPServer, self).server_close()
+        # Forked workers share the socket, only its creator removes it
+        if os.getpid() == self.owner_pid and os.path.exists(
+                self.server_address):
+            os.unlink(self.server_address)
+
+
+class ServerHandler(wsgiref.simple_server.ServerHandler, object):
+    """WSGI handler answering with HTTP/1.1."""
+    http_version = "1.1"
+
+    def cleanup_headers(self):
+        """Set the ``Connection`` header according to the request handler."""
+        super(ServerHandler, self).cleanup_headers()
+        request_handler = self.request_handler
+        if "Content-Length" not in self.headers:
+            # The end of the answer is given by the end of the connection
+            request_handler.close_connection = True
+        if request_handler.close_connection:
+            self.headers["Connection"] = "close"
+        elif request_handler.request_version != "HTTP/1.1":
+            self.headers["Connection"] = "keep-alive"
+
+    def handle_error(self):
+        """Close the connection after errors."""
+        self.request_handler.close_connection = True
+        super(ServerHandler, self).handle_error()
+
 
 class RequestHandler(wsgiref.simple_server.WSGIRequestHandler):
     """HTTP requests handler."""
+    # Keep connections alive between requests
+    protocol_version = "HTTP/1.1"
+    # Close idle connections
+    timeout = config.getint("server", "keepalive_timeout")
+    max_requests = config.getint("server", "keepalive_requests")
+
+    @property
+    def disable_nagle_algorithm(self):
+        """Send the answers at once on TCP connections.
+
+        Headers and bodies are written separately, Nagle's algorithm would
+        delay the bodies until the headers are acknowledged, which can take
+        tens of milliseconds on keep-alive connections.
+
+        """
+        return self.server.address_family in (
+            socket.AF_INET, getattr(socket, "AF_INET6", None))
+
     def log_message(self, *args, **kwargs):
         """Disable inner logging management."""
 
+    def handle(self):
+        """Handle the requests sent on the connection."""
+        for requests_left in range(self.max_requests, 0, -1):
+            self.close_connection = True
+            self.handle_one_request(requests_left)
+            if self.close_connection:
+                break
+
+    def handle_one_request(self, requests_left=1):
+        """Handle a single HTTP request."""
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+        except socket.timeout:
+            # Idle connection
+            return
+        if not self.raw_requestline:
+            # Connection closed by the client
+            return
+        if len(self.raw_requestline) > 65536:
+            self.requestline = self.request_version = self.command = ""
+            self.send_error(client.REQUEST_URI_TOO_LONG)
+            return
+        if not self.parse_request():
+            # An error code has been sent, just exit
+            return
+        if requests_left == 1 or self.server.shutting_down:
+            self.close_connection = True
+
+        with self.server.processing_request():
+            try:
+                body = self.read_body()
+            except ValueError:
+                self.send_error(client.BAD_REQUEST, "Invalid body framing")
+                return
+            except socket.timeout:
+                # Client stopped sending its body
+                self.close_connection = True
+                return
+
+            environ = self.get_environ()
+            environ["CONTENT_LENGTH"] = str(len(body))
+            handler = ServerHandler(
+                io.BytesIO(body), self.wfile, self.get_stderr(), environ,
+                multithread=True)
+            handler.request_handler = self
+            handler.run(self.server.get_app())
+
+    def read_body(self):
+        """Read the request body, according to its length or its chunks.
+
+        Reading the whole body keeps the connection ready for the next request,
+        even if the application ignores the body.
+
+        """
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            chunks = []
+            while True:
+                size = int(self.rfile.readline(65537).split(b";")[0], 16)
+                if size < 0:
+                    raise ValueError("Invalid chunk size")
+                if not size:
+                    # Skip trailers
+                    while self.rfile.readline(65537) not in (
+                            b"\r\n", b"\n", b""):
+                        pass
+                    return b"".join(chunks)
+                chunks.append(self._read(size))
+                self.rfile.readline(65537)
+        length = int(self.headers.get("Content-Length") or 0)
+        if length < 0:
+            raise ValueError("Invalid content length")
+        return self._read(length) if length else b""
+
+    def _read(self, length):
+        """Read ``length`` bytes, raise ``socket.timeout`` if truncated."""
+        data = self.rfile.read(length)
+        if len(data) < length:
+            # Connection closed by the client before the end of the body
+            raise socket.timeout("Truncated body")
+        return data
+
 
 class Application(object):
     """WSGI application managing calendars."""
@@ -112,9 +402,24 @@ class Application(object):
         """Initialize application."""
         super(Application, self).__init__()
         self.acl = acl.load()
+        if self.acl:
+            self.acl = acl.GuardedManager(self.acl)
+            if (config.getint("acl", "cache_ttl") or
+                    config.getint("acl", "cache_negative_ttl")):
+                self.acl = acl.RightsCache(self.acl)
         self.encoding = config.get("encoding", "request")
         if config.getboolean('logging', 'full_environment'):
             self.headers_log = lambda environ: environ
+        self.slow_request_threshold = config.getfloat(
+            "logging", "slow_request_threshold")
+        self.profile_sample = config.getint("logging", "profile_sample")
+        self.profile_folder = os.path.expanduser(
+            config.get("logging", "profile_folder") or tempfile.gettempdir())
+        self._request_counter = itertools.count(1)
+        self.flights = cache.SingleFlight("coalescing")
+        self.responses = cache.ResponseCache(
+            "responses",
+            config.getint("server", "response_cache_size") * 1024 * 1024)
 
     # This method is overriden in __init__ if full_environment is set
     # pylint: disable=E0202
@@ -161,11 +466,124 @@ class Application(object):
         return uri + trailing_slash
 
     def __call__(self, environ, start_response):
+        """Manage a request, trace its phases and sometimes profile it."""
+        method, path = environ["REQUEST_METHOD"], environ["PATH_INFO"]
+        profiler = None
+        if self.profile_sample:
+            number = next(self._request_counter)
+            if not number % self.profile_sample:
+                profiler = profile.Profile()
+
+        response_status = []
+
+        def traced_start_response(status, headers, exc_info=None):
+            """Store the response status for the access log."""
+            response_status.append(status.split(" ", 1)[0])
+            return start_response(status, headers, exc_info)
+
+        metrics.start_tracing()
+        start = time.time()
+        try:
+            if profiler:
+                return profiler.runcall(
+                    self.process, environ, traced_start_response)
+            return self.process(environ, traced_start_response)
+        finally:
+            duration = time.time() - start
+            phases = metrics.stop_tracing()
+            # Arguments are only formatted if the line is logged
+            log.LOGGER.info(
+                "%s \"%s %s\" %s %.3fs", environ.get("REMOTE_ADDR", "-"),
+                method, path, response_status[0] if response_status else "-",
+                duration)
+            if profiler:
+                self.dump_profile(profiler, method, number)
+            if self.slow_request_threshold and (
+                    duration >= self.slow_request_threshold):
+                phases["other"] = max(0, duration - sum(phases.values()))
+                log.LOGGER.warning("Slow request: %s %s %.3fs (%s)" % (
+                    method, path, duration, " ".join(
+                        "%s=%.3fs" % phase for phase in sorted(
+                            phases.items()))))
+
+    def dump_profile(self, profiler, method, number):
+        """Write the statistics of ``profiler`` in the profile folder."""
+        filename = os.path.join(
+            self.profile_folder, "radicale-%s-%i-%i-%s.prof" % (
+                time.strftime("%Y%m%d%H%M%S"), os.getpid(), number,
+                method.lower()))
+        try:
+            profiler.dump_stats(filename)
+        except (IOError, OSError) as exception:
+            log.LOGGER.error("Cannot write profile: %s" % exception)
+        else:
+            log.LOGGER.info("Profile written in %s" % filename)
+
+    def call(self, function, environ, calendars, content, user):
+        """Call the request ``function``, return its status, headers, answer.
+
+        Concurrent identical read requests on the same version of a calendar
+        are coalesced: the first one is processed, the others wait for its
+        answer. Multistatus answers are cached, and given again to the same
+        user for the same request on the same versions of the calendars.
+
+        """
+        method = environ["REQUEST_METHOD"]
+        if not calendars or not isinstance(calendars[0], ical.Calendar) or \
+                method not in COALESCED_METHODS + CACHED_METHODS:
+            return function(environ, calendars, content, user)
+
+        digest = hashlib.md5((content or "").encode("utf-8")).hexdigest()
+        request = (
+            method, environ["PATH_INFO"], environ.get("HTTP_DEPTH"), digest)
+
+        cached = method in CACHED_METHODS and self.responses.size
+        if cached:
+            # Answers depend on the calendars and on their properties
+            key = (user,) + request + tuple(
+                (calendar.path, calendar.version, calendar.props_version)
+                for calendar in calendars
+                if isinstance(calendar, ical.Calendar))
+            response = self.responses.get(key)
+            if response is not None:
+                status, headers, answer = response
+                return status, dict(headers), answer
+
+        if method in COALESCED_METHODS:
+            calendar = calendars[0]
+            status, headers, answer = self.flights.run(
+                request + (calendar.path, calendar.version), function,
+                environ, calendars, content, user)
+            # Headers are changed by the caller
+            headers = dict(headers)
+        else:
+            status, headers, answer = function(
+                environ, calendars, content, user)
+
+        if cached and status == client.MULTI_STATUS and answer:
+            self.responses.set(
+                key, (status, dict(headers), answer), len(answer),
+                [calendar.path for calendar in calendars
+                 if isinstance(calendar, ical.Calendar)])
+        return status, headers, answer
+
+    def process(self, environ, start_response):
         """Manage a request."""
-        log.LOGGER.info("%s request at %s received" % (
+        start = time.time()
+        if metrics.ENABLED and environ["PATH_INFO"] == metrics.PATH:
+            answer = metrics.export().encode("utf-8")
+            start_response("200 OK", [
+                ("Content-Type", "text/plain; version=0.0.4"),
+                ("Content-Length", str(len(answer)))])
+            return [answer]
+
+        # Debug payloads are big, only format them when they are logged
+        debug = log.LOGGER.isEnabledFor(logging.DEBUG)
+        if debug:
+            log.LOGGER.debug("%s request at %s received" % (
                 environ["REQUEST_METHOD"], environ["PATH_INFO"]))
-        headers = pprint.pformat(self.headers_log(environ))
-        log.LOGGER.debug("Request headers:\n%s" % headers)
+            log.LOGGER.debug("Request headers:\n%s" % pprint.pformat(
+                self.headers_log(environ)))
 
         # Sanitize request URI
         environ["PATH_INFO"] = self.sanitize_uri(environ["PATH_INFO"])
@@ -176,13 +594,15 @@ class Application(object):
         if content_length:
             content = self.decode(
                 environ["wsgi.input"].read(content_length), environ)
-            log.LOGGER.debug("Request content:\n%s" % content)
+            if debug:
+                log.LOGGER.debug("Request content:\n%s" % content)
         else:
             content = None
 
         # Find calendar(s)
-        items = ical.Calendar.from_path(
-            environ["PATH_INFO"], environ.get("HTTP_DEPTH", "0"))
+        with metrics.phase("lookup"):
+            items = ical.Calendar.from_path(
+                environ["PATH_INFO"], environ.get("HTTP_DEPTH", "0"))
 
         # Get function corresponding to method
         function = getattr(self, environ["REQUEST_METHOD"].lower())
@@ -190,7 +610,8 @@ class Application(object):
         # Check rights
         if not items or not self.acl:
             # No calendar or no acl, don't check rights
-            status, headers, answer = function(environ, items, content, None)
+            status, headers, answer = self.call(
+                function, environ, items, content, None)
         else:
             # Ask authentication backend to check rights
             authorization = environ.get("HTTP_AUTHORIZATION", None)
@@ -204,6 +625,10 @@ class Application(object):
 
             last_allowed = None
             calendars = []
+            # Rights only depend on the calendar owner, credentials are
+            # checked once per owner for the whole request
+            rights = {}
+            backend_unavailable = False
             for calendar in items:
                 if not isinstance(calendar, ical.Calendar):
                     if last_allowed:
@@ -211,34 +636,50 @@ class Application(object):
                     continue
 
                 if calendar.owner in acl.PUBLIC_USERS:
-                    log.LOGGER.info("Public calendar")
+                    log.LOGGER.debug("Public calendar")
                     calendars.append(calendar)
                     last_allowed = True
                 else:
-                    log.LOGGER.info(
-                        "Checking rights for calendar owned by %s" % (
-                            calendar.owner or "nobody"))
-                    if self.acl.has_right(calendar.owner, user, password):
-                        log.LOGGER.info(
+                    if calendar.owner not in rights:
+                        log.LOGGER.debug(
+                            "Checking rights for calendar owned by %s" % (
+                                calendar.owner or "nobody"))
+                        try:
+                            with metrics.phase("acl"):
+                                rights[calendar.owner] = self.acl.has_right(
+                                    calendar.owner, user, password)
+                        except acl.BackendUnavailable as exception:
+                            log.LOGGER.error(
+                                "Authentication backend error: %s" % exception)
+                            rights[calendar.owner] = False
+                            backend_unavailable = True
+                    if rights[calendar.owner]:
+                        log.LOGGER.debug(
                             "%s allowed" % (user or "Anonymous user"))
                         calendars.append(calendar)
                         last_allowed = True
                     else:
-                        log.LOGGER.info(
+                        log.LOGGER.debug(
                             "%s refused" % (user or "Anonymous user"))
                         last_allowed = False
 
             if calendars:
                 # Calendars found
-                status, headers, answer = function(
-                    environ, calendars, content, user)
+                status, headers, answer = self.call(
+                    function, environ, calendars, content, user)
             elif user and last_allowed is None:
                 # Good user and no calendars found, redirect user to home
                 location = "/%s/" % str(quote(user))
-                log.LOGGER.info("redirecting to %s" % location)
+                log.LOGGER.debug("redirecting to %s" % location)
                 status = client.FOUND
                 headers = {"Location": location}
                 answer = "Redirecting to %s" % location
+            elif backend_unavailable:
+                # Credentials cannot be checked, do not ask for new ones
+                status = client.SERVICE_UNAVAILABLE
+                headers = {"Retry-After": str(config.getint(
+                    "acl", "breaker_delay"))}
+                answer = None
             else:
                 # Unknown or unauthorized user
                 status = client.UNAUTHORIZED
@@ -247,15 +688,28 @@ class Application(object):
                     "Basic realm=\"Radicale Server - Password Required\""}
                 answer = None
 
+        if environ["REQUEST_METHOD"] in WRITE_METHODS:
+            # Cached answers are removed even if the files of the modified
+            # calendars keep the same version
+            for calendar in items:
+                if isinstance(calendar, ical.Calendar):
+                    self.responses.discard(calendar.path)
+
         # Set content length
         if answer:
-            log.LOGGER.debug(
-                "Response content:\n%s" % self.decode(answer, environ))
+            if debug:
+                log.LOGGER.debug(
+                    "Response content:\n%s" % self.decode(answer, environ))
             headers["Content-Length"] = str(len(answer))
 
+        metrics.request(
+            environ["REQUEST_METHOD"], status, content_length,
+            len(answer) if answer else 0, time.time() - start)
+
         # Start response
         status = "%i %s" % (status, client.responses.get(status, "Unknown"))
-        log.LOGGER.debug("Answer status: %s" % status)
+        if debug:
+            log.LOGGER.debug("Answer status: %s" % status)
         start_response(status, list(headers.items()))
 
         # Return response content
@@ -293,7 +747,7 @@ class Application(object):
             # Get calendar item
             item = calendar.get_item(item_name)
             if item:
-                items = calendar.timezones
+                items = timezones.used(calendar.timezones, (item,))
                 items.append(item)
                 answer_text = ical.serialize(
                     headers=calendar.headers, items=items)
@@ -348,6 +802,7 @@ class Application(object):
                         to_path, depth="0")[0]
                     to_calendar.append(to_name, item.text)
                     from_calendar.remove(from_name)
+                    self.responses.discard(to_calendar.path)
                     return client.CREATED, {}, None
                 else:
                     # Remote destination server, not supported
@@ -399,7 +854,9 @@ class Application(object):
             # Case 3: Item and no Etag precondition: Force modifying item
             xmlutils.put(environ["PATH_INFO"], content, calendar)
             status = client.CREATED
-            headers["ETag"] = calendar.get_item(item_name).etag
+            item = calendar.get_item(item_name)
+            if item:
+                headers["ETag"] = item.etag
         else:
             # PUT rejected in all other cases
             status = client.PRECONDITION_FAILED
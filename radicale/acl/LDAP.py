@@ -25,15 +25,140 @@ Authentication based on the ``python-ldap`` module
 
 """
 
+import threading
+import time
+from contextlib import contextmanager
+
 import ldap
 from radicale import acl, config, log
 
 
 BASE = config.get("acl", "ldap_base")
 ATTRIBUTE = config.get("acl", "ldap_attribute")
-CONNEXION = ldap.initialize(config.get("acl", "ldap_url"))
+URL = config.get("acl", "ldap_url")
 BINDDN = config.get("acl", "ldap_binddn")
 PASSWORD = config.get("acl", "ldap_password")
+POOL_SIZE = config.getint("acl", "ldap_pool_size")
+TIMEOUT = config.getint("acl", "ldap_timeout")
+
+# Idle connections older than this number of seconds are checked before use
+CHECK_DELAY = 30
+
+# Errors meaning that a connection cannot be used anymore
+CONNECTION_ERRORS = (ldap.SERVER_DOWN, ldap.TIMEOUT, ldap.CONNECT_ERROR)
+
+# Errors meaning that the credentials cannot be checked
+UNAVAILABLE_ERRORS = CONNECTION_ERRORS + (ldap.BUSY, ldap.UNAVAILABLE)
+
+
+class ConnectionPool(object):
+    """Bounded pool of LDAP connections.
+
+    Connections are created by ``factory`` when needed, checked before being
+    used when they have been idle for a while, and dropped when they are
+    broken. Each connection is used by one thread at a time.
+
+    """
+    def __init__(self, size, factory):
+        """Initialize the pool of at most ``size`` connections."""
+        self.factory = factory
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(size)
+
+    def _get(self):
+        """Get a working connection, idle or new."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection, last_used = self._idle.pop()
+            if time.time() - last_used < CHECK_DELAY:
+                return connection
+            try:
+                connection.whoami_s()
+            except ldap.LDAPError:
+                log.LOGGER.debug("Dropping broken LDAP connection")
+                self._close(connection)
+            else:
+                return connection
+        log.LOGGER.debug("Opening new LDAP connection")
+        return self.factory()
+
+    @staticmethod
+    def _close(connection):
+        """Close ``connection``, ignoring errors."""
+        try:
+            connection.unbind_s()
+        except ldap.LDAPError:
+            pass
+
+    @contextmanager
+    def connection(self):
+        """Get a connection for the ``with`` block."""
+        self._slots.acquire()
+        try:
+            connection = self._get()
+            try:
+                yield connection
+            except CONNECTION_ERRORS:
+                self._close(connection)
+                raise
+            except ldap.LDAPError:
+                # Request errors, the connection can be used again
+                self._release(connection)
+                raise
+            except Exception:
+                self._close(connection)
+                raise
+            else:
+                self._release(connection)
+        finally:
+            self._slots.release()
+
+    def _release(self, connection):
+        """Put ``connection`` back in the pool."""
+        with self._lock:
+            self._idle.append((connection, time.time()))
+
+
+def _connection():
+    """Open a new anonymous LDAP connection."""
+    connection = ldap.initialize(URL)
+    connection.set_option(ldap.OPT_NETWORK_TIMEOUT, TIMEOUT)
+    connection.set_option(ldap.OPT_TIMEOUT, TIMEOUT)
+    return connection
+
+
+def _search_connection():
+    """Open a new LDAP connection used for user searches."""
+    connection = _connection()
+    if BINDDN and PASSWORD:
+        log.LOGGER.debug("Initial LDAP bind as %s" % BINDDN)
+        connection.simple_bind_s(BINDDN, PASSWORD)
+    return connection
+
+
+# Users are searched with connections bound once as ``BINDDN``, and bound
+# with other connections, so that the initial bind is kept
+SEARCH_POOL = ConnectionPool(POOL_SIZE, _search_connection)
+BIND_POOL = ConnectionPool(POOL_SIZE, _connection)
+
+
+def _call(pool, method, *args):
+    """Call ``method`` with a connection of ``pool``.
+
+    The call is tried again with a new connection if the server has dropped
+    the first one, after a restart for example.
+
+    """
+    try:
+        with pool.connection() as connection:
+            return getattr(connection, method)(*args)
+    except ldap.SERVER_DOWN:
+        log.LOGGER.debug("LDAP server down, reconnecting")
+        with pool.connection() as connection:
+            return getattr(connection, method)(*args)
 
 
 def has_right(owner, user, password):
@@ -42,19 +167,27 @@ def has_right(owner, user, password):
         # No user given, or owner is not private and is not user, forbidden
         return False
 
-    if BINDDN and PASSWORD:
-        log.LOGGER.debug("Initial LDAP bind as %s" % BINDDN)
-        CONNEXION.simple_bind_s(BINDDN, PASSWORD)
-
     distinguished_name = "%s=%s" % (ATTRIBUTE, ldap.dn.escape_dn_chars(user))
     log.LOGGER.debug(
         "LDAP bind for %s in base %s" % (distinguished_name, BASE))
 
-    users = CONNEXION.search_s(BASE, ldap.SCOPE_ONELEVEL, distinguished_name)
+    try:
+        users = _call(
+            SEARCH_POOL, "search_s", BASE, ldap.SCOPE_ONELEVEL,
+            distinguished_name)
+    except UNAVAILABLE_ERRORS as exception:
+        raise acl.BackendUnavailable("LDAP server unavailable: %s" % exception)
+    except ldap.LDAPError as exception:
+        log.LOGGER.debug("LDAP search failed: %s" % exception)
+        return False
+
     if users:
         log.LOGGER.debug("User %s found" % user)
         try:
-            CONNEXION.simple_bind_s(users[0][0], password or "")
+            _call(BIND_POOL, "simple_bind_s", users[0][0], password or "")
+        except UNAVAILABLE_ERRORS as exception:
+            raise acl.BackendUnavailable(
+                "LDAP server unavailable: %s" % exception)
         except ldap.LDAPError:
             log.LOGGER.debug("Invalid credentials")
         else:
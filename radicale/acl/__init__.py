@@ -26,13 +26,34 @@ configuration.
 
 """
 
-from radicale import config
+import hashlib
+import os
+import threading
+import time
+try:
+    from collections import OrderedDict
+except ImportError:
+    # Python 2.6 has no OrderedDict, use a dict instead
+    OrderedDict = dict # pylint: disable=C0103
+# Manage Python2/3 different modules
+# pylint: disable=F0401
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+# pylint: enable=F0401
+
+from radicale import config, log, metrics
 
 
 PUBLIC_USERS = []
 PRIVATE_USERS = []
 
 
+class BackendUnavailable(Exception):
+    """The authentication backend cannot check the credentials."""
+
+
 def _config_users(name):
     """Get an iterable of strings from the configuraton string [acl] ``name``.
 
@@ -55,3 +76,155 @@ def load():
         PRIVATE_USERS.extend(_config_users("private_users"))
         module = __import__("radicale.acl", fromlist=[acl_type])
         return getattr(module, acl_type)
+
+
+class RightsCache(object):
+    """Cache of the rights given by an ACL manager.
+
+    Successful checks are kept for ``[acl] cache_ttl`` seconds, failed checks
+    for ``[acl] cache_negative_ttl`` seconds, so that repeated requests and
+    brute-force attacks do not reach the authentication backend. Passwords
+    are only stored as salted digests.
+
+    """
+    def __init__(self, manager):
+        """Initialize the cache in front of the ``manager`` ACL module."""
+        self.manager = manager
+        self.ttl = config.getint("acl", "cache_ttl")
+        self.negative_ttl = config.getint("acl", "cache_negative_ttl")
+        self.size = config.getint("acl", "cache_size")
+        self._salt = os.urandom(16)
+        self._rights = OrderedDict()
+        self._lock = threading.Lock()
+
+    def has_right(self, owner, user, password):
+        """Check if ``user``/``password`` couple is valid for ``owner``."""
+        if not user:
+            # Nothing worth caching for anonymous users
+            return self.manager.has_right(owner, user, password)
+
+        digest = hashlib.sha256(
+            self._salt + (password or "").encode("utf-8")).digest()
+        # The rights depend on the owner of the calendar too
+        key = (owner, user, digest)
+        now = time.time()
+        with self._lock:
+            right = self._rights.pop(key, None)
+            if right and right[1] > now:
+                # Put the key at the end, the most recently used position
+                self._rights[key] = right
+                metrics.cache("acl", True)
+                return right[0]
+        metrics.cache("acl", False)
+
+        allowed = self.manager.has_right(owner, user, password)
+        ttl = self.ttl if allowed else self.negative_ttl
+        if ttl > 0:
+            with self._lock:
+                self._rights[key] = (allowed, now + ttl)
+                while len(self._rights) > self.size:
+                    del self._rights[next(iter(self._rights))]
+        return allowed
+
+
+class GuardedManager(object):
+    """ACL manager whose calls run in a bounded pool of threads.
+
+    Calls not answered within ``[acl] backend_timeout`` seconds fail, so that
+    a hanging backend does not hang the request threads. After ``[acl]
+    breaker_failures`` failures in a row, the circuit breaker opens: calls
+    fail immediately during ``[acl] breaker_delay`` seconds, then a single
+    call is tried to know whether the backend is back.
+
+    Failed calls raise ``BackendUnavailable``. Managers raise exceptions when
+    they cannot check the credentials, and return ``False`` only when the
+    credentials are refused. Calls refused because all the threads are busy
+    do not count as failures of the backend.
+
+    """
+    def __init__(self, manager):
+        """Initialize the guard in front of the ``manager`` ACL module."""
+        self.manager = manager
+        self.timeout = config.getint("acl", "backend_timeout")
+        self.threads = config.getint("acl", "backend_threads")
+        self.max_failures = config.getint("acl", "breaker_failures")
+        self.delay = config.getint("acl", "breaker_delay")
+        # Calls waiting for a thread, refused when all the threads are busy
+        self._calls = queue.Queue(self.threads)
+        self._workers = []
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened = None
+        self._trying = False
+
+    def _work(self):
+        """Run the calls of the queue."""
+        while True:
+            function, args, result, done = self._calls.get()
+            try:
+                result.append((True, function(*args)))
+            except Exception as exception:  # pylint: disable=W0703
+                result.append((False, exception))
+            done.set()
+
+    def _allow(self):
+        """Return whether the circuit breaker lets a call go."""
+        with self._lock:
+            if not self._workers:
+                for _ in range(self.threads):
+                    worker = threading.Thread(target=self._work)
+                    worker.daemon = True
+                    worker.start()
+                    self._workers.append(worker)
+            if self._opened is None:
+                return True
+            if self._trying or time.time() - self._opened < self.delay:
+                return False
+            # Half-open breaker, let one call try the backend
+            self._trying = True
+            return True
+
+    def _record(self, success):
+        """Update the circuit breaker with the result of a call."""
+        with self._lock:
+            self._trying = False
+            if success:
+                if self._opened is not None:
+                    log.LOGGER.info("Authentication backend available again")
+                self._failures = 0
+                self._opened = None
+            else:
+                self._failures += 1
+                if self._opened is not None or (
+                        self._failures >= self.max_failures):
+                    if self._opened is None:
+                        log.LOGGER.error("Authentication backend unavailable")
+                    self._opened = time.time()
+
+    def has_right(self, owner, user, password):
+        """Check if ``user``/``password`` couple is valid for ``owner``."""
+        if not self._allow():
+            raise BackendUnavailable("Circuit breaker open")
+
+        result = []
+        done = threading.Event()
+        try:
+            self._calls.put_nowait((
+                self.manager.has_right, (owner, user, password), result,
+                done))
+        except queue.Full:
+            # The backend is busy, not broken: the breaker is not updated
+            with self._lock:
+                self._trying = False
+            raise BackendUnavailable("All backend threads busy")
+
+        with metrics.timer("acl_duration_seconds"):
+            done.wait(self.timeout)
+        if not result:
+            self._record(False)
+            raise BackendUnavailable("Timeout")
+        success, value = result[0]
+        self._record(success)
+        if not success:
+            raise BackendUnavailable(value)
+        return value
@@ -27,6 +27,9 @@ from radicale import acl, config, log
 
 
 COURIER_SOCKET = config.get("acl", "courier_socket")
+# The connection and the answer each get half of the time given to the
+# backend, the socket times out before the guarded call
+TIMEOUT = config.getint("acl", "backend_timeout") / 2.0
 
 
 def has_right(owner, user, password):
@@ -39,19 +42,22 @@ def has_right(owner, user, password):
     line = "%i\n%s" % (len(line), line)
     try:
         sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(TIMEOUT)
         sock.connect(COURIER_SOCKET)
         log.LOGGER.debug("Sending to Courier socket the request: %s" % line)
-        sock.send(line)
+        sock.sendall(line.encode("utf-8"))
         data = sock.recv(1024)
         sock.close()
-    except socket.error, (_, message):
-        log.LOGGER.debug(
-            "Unable to communicate with Courier socket: %s" % message)
-        return False
+    except socket.error as exception:
+        # Timeouts included, the credentials have not been checked
+        raise acl.BackendUnavailable(
+            "Unable to communicate with Courier socket: %s" % exception)
 
     log.LOGGER.debug("Got Courier socket response: %r" % data)
 
-    if repr(data) == "FAIL":
+    if not data:
+        raise acl.BackendUnavailable("No answer from Courier socket")
+    if data.startswith(b"FAIL"):
         return False
 
     return True
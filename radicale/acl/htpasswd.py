@@ -29,6 +29,8 @@ supported, but md5 is not (see ``htpasswd`` man page to understand why).
 
 import base64
 import hashlib
+import os
+import threading
 
 from radicale import acl, config
 
@@ -36,6 +38,11 @@ from radicale import acl, config
 FILENAME = config.get("acl", "htpasswd_filename")
 ENCRYPTION = config.get("acl", "htpasswd_encryption")
 
+# Login/hash couples of the file, with the version of the file they are read
+# from, updated by ``_users``
+_USERS = {"version": None, "users": {}}
+_USERS_LOCK = threading.Lock()
+
 
 def _plain(hash_value, password):
     """Check if ``hash_value`` and ``password`` match using plain method."""
@@ -58,11 +65,29 @@ def _sha1(hash_value, password):
     return sha1.digest() == base64.b64decode(hash_value)
 
 
+def _users():
+    """Get the login/hash dictionary, read again when the file is modified."""
+    stat = os.stat(FILENAME)
+    version = (stat.st_mtime, stat.st_size)
+    if version != _USERS["version"]:
+        with _USERS_LOCK:
+            if version != _USERS["version"]:
+                users = {}
+                for line in open(FILENAME).readlines():
+                    if line.strip():
+                        login, hash_value = line.strip().split(":", 1)
+                        # The first line of a login is used
+                        users.setdefault(login, hash_value)
+                _USERS["users"] = users
+                _USERS["version"] = version
+    return _USERS["users"]
+
+
 def has_right(owner, user, password):
     """Check if ``user``/``password`` couple is valid."""
-    for line in open(FILENAME).readlines():
-        if line.strip():
-            login, hash_value = line.strip().split(":")
-            if login == user and (owner in acl.PRIVATE_USERS or owner == user):
-                return globals()["_%s" % ENCRYPTION](hash_value, password)
-    return False
+    if owner not in acl.PRIVATE_USERS and owner != user:
+        return False
+    hash_value = _users().get(user)
+    if hash_value is None:
+        return False
+    return globals()["_%s" % ENCRYPTION](hash_value, password)
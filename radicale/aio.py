@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Radicale Server - Calendar Server
+# Copyright © 2011 Guillaume Ayoub
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Radicale asyncio front end.
+
+Connections are managed by coroutines running in an event loop, idle
+keep-alive connections cost nearly nothing. Parsed requests are given to the
+WSGI application in a pool of threads.
+
+This module needs Python 3.5 or later, it is only imported when the asyncio
+front end is selected.
+
+"""
+
+import asyncio
+import concurrent.futures
+import io
+import os
+import socket
+import ssl
+import sys
+import threading
+from email.utils import formatdate
+from http import client
+from urllib.parse import unquote
+
+from radicale import bind_unix_socket, config, load_certificate, log, \
+    ssl_context
+
+
+TIMEOUT = config.getint("server", "keepalive_timeout")
+MAX_REQUESTS = config.getint("server", "keepalive_requests")
+THREADS = config.getint("server", "threads")
+MAX_HEADERS = 100
+# Time given to the requests being processed when the server stops, in seconds
+SHUTDOWN_TIMEOUT = 30
+
+
+class BadRequest(Exception):
+    """Request that cannot be parsed."""
+    def __init__(self, message, status=client.BAD_REQUEST):
+        """Create error with ``message``, answered with ``status``."""
+        super(BadRequest, self).__init__(message)
+        self.status = status
+
+
+def _current_task():
+    """Return the task running in the event loop of the current thread."""
+    # ``asyncio.current_task`` appears in Python 3.7
+    current_task = getattr(asyncio, "current_task", None)
+    if current_task is None:
+        current_task = asyncio.Task.current_task  # pylint: disable=E1101
+    return current_task()
+
+
+async def _readline(reader, status=client.BAD_REQUEST):
+    """Read and return a line, raise ``BadRequest`` if it is too long."""
+    try:
+        return await reader.readline()
+    except ValueError:
+        # Lines longer than the limit of the reader
+        raise BadRequest("Line too long", status)
+
+
+class AsyncServer(object):
+    """HTTP server running in an asyncio event loop.
+
+    The interface mimics ``socketserver``: the socket is bound when the
+    server is created, ``serve_forever`` runs the loop until ``shutdown`` is
+    called from another thread.
+
+    """
+    def __init__(self, address, application, use_ssl=False):
+        """Create server and bind its socket to ``address``.
+
+        ``address`` is a ``(host, port)`` tuple, or the path of a Unix domain
+        socket.
+
+        """
+        self.owner_pid = os.getpid()
+        if isinstance(address, str):
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            bind_unix_socket(self.socket, address)
+            self.server_name, self.server_port = address, 0
+        else:
+            host = address[0]
+            family = socket.AF_INET6 if ":" in host else socket.AF_INET
+            self.socket = socket.socket(family, socket.SOCK_STREAM)
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if family == socket.AF_INET6:
+                # Only allow IPv6 connections to the IPv6 socket
+                self.socket.setsockopt(
+                    socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+            self.socket.bind(address)
+            self.server_name = socket.getfqdn(host)
+            self.server_port = self.socket.getsockname()[1]
+        self.socket.listen(128)
+        self.socket.setblocking(False)
+
+        self.application = application
+        self.ssl_context = ssl_context() if use_ssl else None
+        self._loop = None
+        self._server = None
+        self._stopped = threading.Event()
+        self._stopping = False
+        # Connection handler tasks, ``True`` when waiting for a request
+        self._handlers = {}
+
+    def serve_forever(self):
+        """Run the event loop until ``shutdown`` is called."""
+        loop = asyncio.new_event_loop()
+        executor = concurrent.futures.ThreadPoolExecutor(THREADS)
+        self._server = server = loop.run_until_complete(asyncio.start_server(
+            lambda reader, writer: self._handle(reader, writer, executor),
+            sock=self.socket, ssl=self.ssl_context))
+        # The loop is given to ``shutdown`` once the server is started
+        self._loop = loop
+        try:
+            if not self._stopping:
+                loop.run_forever()
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            executor.shutdown(wait=True)
+            loop.close()
+            self._stopped.set()
+
+    def shutdown(self):
+        """Stop the server, wait until it is stopped.
+
+        New connections are refused, the requests being processed are
+        answered, then the connections are closed and the event loop stopped.
+
+        """
+        self._stopping = True
+        if self._loop is None:
+            # Server not started yet, ``serve_forever`` does not run the loop
+            return
+        try:
+            self._loop.call_soon_threadsafe(
+                lambda: asyncio.ensure_future(self._stop(), loop=self._loop))
+        except RuntimeError:
+            # Loop already closed by ``serve_forever``
+            pass
+        self._stopped.wait()
+
+    async def _stop(self):
+        """Stop accepting connections, wait for the handlers, stop the loop."""
+        self._stopping = True
+        self._server.close()
+        # Idle connections are closed at once
+        for task, waiting in list(self._handlers.items()):
+            if waiting:
+                task.cancel()
+        handlers = list(self._handlers)
+        if handlers:
+            _, pending = await asyncio.wait(handlers, timeout=SHUTDOWN_TIMEOUT)
+            if pending:
+                log.LOGGER.warning(
+                    "%i connections closed before their requests were "
+                    "answered" % len(pending))
+                for task in pending:
+                    task.cancel()
+                await asyncio.wait(pending)
+        self._loop.stop()
+
+    def reload_certificate(self):
+        """Use the current certificate and key for the new connections."""
+        if self.ssl_context is not None and self._loop is not None:
+            # Handshakes are done in the loop, load the files in its thread
+            self._loop.call_soon_threadsafe(
+                load_certificate, self.ssl_context)
+
+    def server_close(self):
+        """Close the listening socket, remove the Unix socket file."""
+        self.socket.close()
+        # Forked workers share the socket, only its creator removes it
+        if self.socket.family == getattr(socket, "AF_UNIX", None) and (
+                os.getpid() == self.owner_pid and
+                os.path.exists(self.server_name)):
+            os.unlink(self.server_name)
+
+    async def _handle(self, reader, writer, executor):
+        """Answer the requests sent on a connection."""
+        peer = writer.get_extra_info("peername") or ("", 0)
+        task = _current_task()
+        try:
+            for requests_left in range(MAX_REQUESTS, 0, -1):
+                if self._stopping:
+                    break
+                self._handlers[task] = True
+                try:
+                    try:
+                        request_line = await asyncio.wait_for(
+                            self._read_request_line(reader), TIMEOUT)
+                    except asyncio.TimeoutError:
+                        # Idle connection
+                        break
+                    self._handlers[task] = False
+                    if not request_line:
+                        # Connection closed by the client
+                        break
+                    request = await asyncio.wait_for(self._read_request(
+                        reader, writer, request_line), TIMEOUT)
+                except asyncio.TimeoutError:
+                    # Client stopped sending its request
+                    writer.write(self._response(
+                        "HTTP/1.1", client.REQUEST_TIMEOUT, [], b"", False))
+                    break
+                except BadRequest as exception:
+                    log.LOGGER.debug("Bad request: %s" % exception)
+                    writer.write(self._response(
+                        "HTTP/1.1", exception.status, [], b"", False))
+                    break
+
+                environ, keep_alive = self._environ(request, peer)
+                status, headers, answer = await self._loop.run_in_executor(
+                    executor, self._call, environ)
+                # Connections are closed after their last request
+                keep_alive = keep_alive and requests_left > 1 and \
+                    not self._stopping
+                writer.write(self._response(
+                    request[2], status, headers, answer, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ssl.SSLError):
+            pass
+        except asyncio.CancelledError:
+            # Connection closed by ``shutdown``
+            pass
+        finally:
+            self._handlers.pop(task, None)
+            writer.close()
+
+    @staticmethod
+    async def _read_request_line(reader):
+        """Read and return a request line, empty if closed."""
+        request_line = b"\r\n"
+        while request_line in (b"\r\n", b"\n"):
+            # Ignore empty lines sent before the request line (rfc2616-4.1)
+            request_line = await _readline(
+                reader, client.REQUEST_URI_TOO_LONG)
+        return request_line
+
+    @staticmethod
+    async def _read_request(reader, writer, request_line):
+        """Read the rest of the request, return it as a tuple."""
+        try:
+            method, target, version = request_line.decode(
+                "iso-8859-1").split()
+        except ValueError:
+            raise BadRequest("Invalid request line %r" % request_line)
+
+        headers = []
+        while True:
+            line = await _readline(
+                reader, client.REQUEST_HEADER_FIELDS_TOO_LARGE)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            if len(headers) == MAX_HEADERS or b":" not in line:
+                raise BadRequest("Invalid headers")
+            name, value = line.decode("iso-8859-1").split(":", 1)
+            headers.append((name.strip().lower(), value.strip()))
+        header_dict = dict(headers)
+
+        if header_dict.get("expect", "").lower() == "100-continue":
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+
+        if "chunked" in header_dict.get("transfer-encoding", "").lower():
+            chunks = []
+            while True:
+                size = (await _readline(reader)).split(b";", 1)[0].strip()
+                try:
+                    size = int(size, 16)
+                except ValueError:
+                    raise BadRequest("Invalid chunk size %r" % size)
+                if size < 0:
+                    raise BadRequest("Invalid chunk size %r" % size)
+                if not size:
+                    # Skip trailers
+                    while (await _readline(reader)) not in (
+                            b"\r\n", b"\n", b""):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await _readline(reader)
+            body = b"".join(chunks)
+        else:
+            try:
+                length = int(header_dict.get("content-length") or 0)
+            except ValueError:
+                raise BadRequest("Invalid content length")
+            if length < 0:
+                raise BadRequest("Invalid content length")
+            body = await reader.readexactly(length) if length else b""
+
+        return method, target, version, headers, body
+
+    def _environ(self, request, peer):
+        """Build the WSGI environment of ``request``."""
+        method, target, version, headers, body = request
+        path, _, query = target.partition("?")
+        environ = {
+            "REQUEST_METHOD": method,
+            "SCRIPT_NAME": "",
+            "PATH_INFO": unquote(path, "iso-8859-1"),
+            "QUERY_STRING": query,
+            "CONTENT_LENGTH": str(len(body)),
+            "SERVER_NAME": self.server_name,
+            "SERVER_PORT": str(self.server_port),
+            "SERVER_PROTOCOL": version,
+            "REMOTE_ADDR": peer[0],
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "https" if self.ssl_context else "http",
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False}
+        connection = ""
+        for name, value in headers:
+            if name == "content-type":
+                environ["CONTENT_TYPE"] = value
+            elif name in ("content-length", "transfer-encoding"):
+                # The body is already decoded
+                continue
+            else:
+                if name == "connection":
+                    connection = value.lower()
+                key = "HTTP_%s" % name.upper().replace("-", "_")
+                if key in environ:
+                    environ[key] += ",%s" % value
+                else:
+                    environ[key] = value
+
+        if version == "HTTP/1.1":
+            keep_alive = "close" not in connection
+        else:
+            keep_alive = "keep-alive" in connection
+        return environ, keep_alive
+
+    def _call(self, environ):
+        """Call the WSGI application, return status, headers and answer."""
+        response = []
+
+        def start_response(status, headers, exc_info=None):
+            """Store response status and headers."""
+            response[:] = [status, headers]
+
+        try:
+            answer = b"".join(self.application(environ, start_response))
+        except Exception:  # pylint: disable=W0703
+            log.LOGGER.exception("Error while processing request")
+            status = "%i %s" % (
+                client.INTERNAL_SERVER_ERROR,
+                client.responses[client.INTERNAL_SERVER_ERROR])
+            return status, [], b""
+        return response[0], response[1], answer
+
+    @staticmethod
+    def _response(version, status, headers, answer, keep_alive):
+        """Return the raw bytes of an HTTP response."""
+        if isinstance(status, int):
+            status = "%i %s" % (status, client.responses[status])
+        lines = ["%s %s" % (version, status)]
+        lines.extend("%s: %s" % header for header in headers
+                     if header[0].lower() != "content-length")
+        lines.append("Content-Length: %i" % len(answer))
+        lines.append("Date: %s" % formatdate(usegmt=True))
+        lines.append("Connection: %s" % (
+            "keep-alive" if keep_alive else "close"))
+        lines.append("\r\n")
+        return "\r\n".join(lines).encode("iso-8859-1") + answer
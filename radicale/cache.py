@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Radicale Server - Calendar Server
+# Copyright © 2011 Guillaume Ayoub
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Radicale request caches.
+
+Share the work done for identical read requests: concurrent requests wait
+for the answer of the first one instead of reading and parsing the same
+calendar again, and repeated requests on unchanged calendars get the
+answers kept in memory.
+
+"""
+
+import threading
+try:
+    from collections import OrderedDict
+except ImportError:
+    # Python 2.6 has no OrderedDict, use a dict instead
+    OrderedDict = dict # pylint: disable=C0103
+
+from radicale import metrics
+
+
+class _Call(object):
+    """Call shared by concurrent identical requests."""
+    def __init__(self):
+        """Initialize a call with no result."""
+        self.event = threading.Event()
+        self.result = self.error = None
+
+
+class SingleFlight(object):
+    """Coalesce the concurrent calls with the same key."""
+    def __init__(self, name):
+        """Initialize the coalescing of the calls called ``name``.
+
+        ``name`` labels the metrics of the coalesced calls.
+
+        """
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def run(self, key, function, *args):
+        """Call ``function`` with ``args``, return its result.
+
+        If a call with the same ``key`` is running in another thread, wait for
+        its result instead. Exceptions are raised in all the waiting threads.
+
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            first = call is None
+            if first:
+                call = self._calls[key] = _Call()
+        metrics.cache(self.name, not first)
+
+        if not first:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args)
+        except Exception as exception:
+            call.error = exception
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+
+class ResponseCache(object):
+    """Cache of answers, the least recently used being removed first.
+
+    Keys must include the versions of the calendars used by the answers, so
+    that answers of old versions are never found again. Answers are tagged
+    with the paths of these calendars, and removed with ``discard`` when
+    the calendars are modified by the current process.
+
+    """
+    def __init__(self, name, size):
+        """Initialize the cache called ``name``, keeping ``size`` bytes.
+
+        ``name`` labels the metrics of the cache lookups.
+
+        """
+        self.name = name
+        self.size = size
+        self._lock = threading.Lock()
+        self._answers = OrderedDict()
+        self._total = 0
+
+    def get(self, key):
+        """Get the value stored with ``key``, ``None`` if missing."""
+        with self._lock:
+            value = self._answers.pop(key, None)
+            if value is not None:
+                # Move the value at the end of the LRU list
+                self._answers[key] = value
+        metrics.cache(self.name, value is not None)
+        return value[0] if value is not None else None
+
+    def set(self, key, value, length, tags=()):
+        """Store ``value`` of ``length`` bytes with ``key`` and ``tags``."""
+        if length > self.size:
+            return
+        with self._lock:
+            old_value = self._answers.pop(key, None)
+            if old_value is not None:
+                self._total -= old_value[1]
+            self._answers[key] = (value, length, frozenset(tags))
+            self._total += length
+            while self._total > self.size:
+                self._total -= self._answers.pop(next(iter(self._answers)))[1]
+
+    def discard(self, tag):
+        """Remove the values stored with ``tag``."""
+        with self._lock:
+            for key, value in list(self._answers.items()):
+                if tag in value[2]:
+                    self._total -= value[1]
+                    del self._answers[key]
@@ -42,6 +42,16 @@ INITIAL_CONFIG = {
         "hosts": "0.0.0.0:5232",
         "daemon": "False",
         "pid": "",
+        "workers": "1",
+        "frontend": "threads",
+        "threads": "16",
+        "keepalive_timeout": "15",
+        "keepalive_requests": "100",
+        "max_instances": "1000",
+        "report_processes": "0",
+        "report_offload_size": "1000000",
+        "response_cache_size": "10",
+        "socket_mode": "660",
         "ssl": "False",
         "certificate": "/etc/apache2/ssl/server.crt",
         "key": "/etc/apache2/ssl/server.key"},
@@ -58,13 +68,30 @@ INITIAL_CONFIG = {
         "ldap_base": "ou=users,dc=example,dc=com",
         "ldap_attribute": "uid",
         "ldap_binddn": "",
-        "ldap_password": ""},
+        "ldap_password": "",
+        "ldap_pool_size": "10",
+        "ldap_timeout": "10",
+        "cache_ttl": "60",
+        "cache_negative_ttl": "5",
+        "cache_size": "1024",
+        "backend_timeout": "10",
+        "backend_threads": "4",
+        "breaker_failures": "5",
+        "breaker_delay": "30"},
     "storage": {
-        "folder": os.path.expanduser("~/.config/radicale/calendars")},
+        "folder": os.path.expanduser("~/.config/radicale/calendars"),
+        "cache_size": "100"},
+    "metrics": {
+        "enabled": "False",
+        "path": "/.metrics"},
     "logging": {
         "config": "/etc/radicale/logging",
         "debug": "False",
-        "full_environment": "False"}}
+        "full_environment": "False",
+        "asynchronous": "False",
+        "slow_request_threshold": "0",
+        "profile_sample": "0",
+        "profile_folder": ""}}
 
 # Create a ConfigParser and configure it
 _CONFIG_PARSER = ConfigParser()
@@ -27,18 +27,55 @@ Define the main classes of a calendar as seen from the server.
 
 from datetime import datetime
 import codecs
+import hashlib
 from contextlib import contextmanager
+from itertools import chain
 import json
 import os
 import posixpath
+import re
+import threading
 import time
 import uuid
+try:
+    from collections import OrderedDict
+except ImportError:
+    # Python 2.6 has no OrderedDict, use a dict instead
+    OrderedDict = dict # pylint: disable=C0103
 
-from radicale import config
+from radicale import config, metrics, timezones
 
 
 FOLDER = os.path.expanduser(config.get("storage", "folder"))
 
+# Maximum number of characters of the cached calendars
+CACHE_SIZE = config.getint("storage", "cache_size") * 1024 * 1024
+
+# Line break followed by the whitespace of a folded line
+FOLDING_REGEX = re.compile(r"(?:\r\n|\r|\n)[ \t]")
+
+# Lines giving the name of items, read when items are created
+NAME_REGEX = re.compile(
+    r"^(X-RADICALE-NAME|TZID|UID):(.*(?:\r?\n[ \t].*)*)$", re.MULTILINE)
+
+# TZID parameters of the properties
+TZID_REGEX = re.compile(r';TZID=("[^"]*"|[^;:\n]*)')
+
+# First lines of the components
+BEGIN_REGEX = re.compile(r"^BEGIN:(.*)$", re.MULTILINE)
+
+# Header lines of the calendars
+PRODID_REGEX = re.compile(r"^PRODID:.*(?:\n[ \t].*)*$", re.MULTILINE)
+VERSION_REGEX = re.compile(r"^VERSION:.*(?:\n[ \t].*)*$", re.MULTILINE)
+
+# Parsed dates, shared by all the items
+_DATES = {}
+_DATES_SIZE = 4096
+
+# Parsed calendars, by path, the least recently used first
+_CACHE = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+
 
 # This function overrides the builtin ``open`` function for this module
 # pylint: disable=W0622
@@ -50,12 +87,9 @@ def open(path, mode="r"):
 
 def serialize(headers=(), items=()):
     """Return an iCal text corresponding to given ``headers`` and ``items``."""
-    lines = ["BEGIN:VCALENDAR"]
-    for part in (headers, items):
-        if part:
-            lines.append("\n".join(item.text for item in part))
-    lines.append("END:VCALENDAR\n")
-    return "\n".join(lines)
+    return "\n".join(chain(
+        ("BEGIN:VCALENDAR",), (header.text for header in headers),
+        (item.text for item in items), ("END:VCALENDAR\n",)))
 
 
 def unfold(text):
@@ -64,17 +98,146 @@ def unfold(text):
     Read rfc5545-3.1 for info.
 
     """
-    lines = []
-    for line in text.splitlines():
-        if lines and (line.startswith(" ") or line.startswith("\t")):
-            lines[-1] += line[1:]
+    return _unfold_text(text).splitlines()
+
+
+def _unfold_text(text):
+    """Return ``text`` with unfolded multi-lines attributes."""
+    if "\r" in text:
+        return FOLDING_REGEX.sub("", text)
+    # Faster than the regex for the common case
+    return text.replace("\n ", "").replace("\n\t", "")
+
+
+def _normalize_newlines(text):
+    """Return ``text`` with ``\\n`` line breaks."""
+    return text.replace("\r\n", "\n") if "\r" in text else text
+
+
+def _spans(text, tags=None, start=0, end=None):
+    """Find the components with a tag in ``tags`` in ``text``.
+
+    Components with other tags are searched for sub-components, all the
+    components are found if ``tags`` is ``None``. Newlines of ``text`` must be
+    normalized.
+
+    Return an iterator on the ``(tag, start, end)`` of the components.
+
+    """
+    end = len(text) if end is None else end
+    position = start
+    while True:
+        match = BEGIN_REGEX.search(text, position, end)
+        if match is None:
+            return
+        tag = match.group(1).strip()
+        if tags is not None and tag not in tags:
+            position = match.end()
+            continue
+        position = text.find("\nEND:%s" % tag, match.end(), end)
+        if position == -1:
+            # Unfinished component
+            return
+        position = text.find("\n", position + 1, end)
+        if position == -1:
+            position = end
+        yield tag, match.start(), position
+
+
+def parse_date(value):
+    """Return the datetime of an iCal DATE-TIME or DATE ``value``.
+
+    Read rfc5545-3.3.4 and rfc5545-3.3.5 for info. Dates are naive, the
+    trailing ``Z`` of UTC times is ignored.
+
+    """
+    date = _DATES.get(value)
+    if date is None:
+        digits = value[:-1] if value.endswith("Z") else value
+        if len(digits) == 15 and digits[8] == "T" and (
+                digits[:8] + digits[9:]).isdigit():
+            date = datetime(
+                int(digits[:4]), int(digits[4:6]), int(digits[6:8]),
+                int(digits[9:11]), int(digits[11:13]), int(digits[13:]))
+        elif len(digits) == 8 and digits.isdigit():
+            date = datetime(
+                int(digits[:4]), int(digits[4:6]), int(digits[6:8]))
         else:
-            lines.append(line)
-    return lines
+            raise ValueError("Invalid date %r" % value)
+        if len(_DATES) >= _DATES_SIZE:
+            _DATES.clear()
+        _DATES[value] = date
+    return date
+
+
+def format_date(date, template):
+    """Return the iCal value of ``date``, in the format of ``template``.
+
+    ``template`` is an iCal DATE, UTC DATE-TIME or local DATE-TIME value.
+
+    """
+    if len(template) == 8:
+        return date.strftime("%Y%m%d")
+    elif template.endswith("Z"):
+        return date.strftime("%Y%m%dT%H%M%SZ")
+    return date.strftime("%Y%m%dT%H%M%S")
+
+
+def split_line(line):
+    """Return the name, the parameters and the value of a content line.
+
+    The parameters are returned as raw text, including their leading
+    semicolon. Read rfc5545-3.1 for info.
+
+    """
+    colon = line.find(":")
+    semicolon = line.find(";", 0, colon)
+    if semicolon == -1:
+        return line[:colon], "", line[colon + 1:]
+    if '"' in line:
+        # Colons are allowed in quoted parameter values
+        in_quotes = False
+        for index in range(semicolon, len(line)):
+            character = line[index]
+            if character == '"':
+                in_quotes = not in_quotes
+            elif character == ":" and not in_quotes:
+                colon = index
+                break
+    return line[:semicolon], line[semicolon:colon], line[colon + 1:]
+
+
+class Property(object):
+    """Internal iCal property, with lazily parsed parameters."""
+    __slots__ = ("name", "params_text", "value", "_params")
+
+    def __init__(self, line):
+        """Initialize object from an unfolded content ``line``."""
+        self.name, self.params_text, self.value = split_line(line)
+        self._params = None
+
+    @property
+    def line(self):
+        """Content line of the property."""
+        return "%s%s:%s" % (self.name, self.params_text, self.value)
+
+    @property
+    def params(self):
+        """Dict of the parameters, names in upper case."""
+        if self._params is None:
+            self._params = {}
+            for param in self.params_text[1:].split(";"):
+                if "=" in param:
+                    name, value = param.split("=", 1)
+                    self._params[name.upper()] = value.strip('"')
+        return self._params
+
 
 class Rrule(object):
     """Internal rrule item.
     """
+    __slots__ = ("_rrule",)
+
     def __init__(self, rrule=None):
         """Initialize object from rrule
         """
@@ -88,84 +251,261 @@ class Rrule(object):
         return self._rrule
 
 class Item(object):
-    """Internal iCal item."""
-    def __init__(self, text, name=None):
-        """Initialize object from ``text`` and different ``kwargs``."""
-        self.text = text
+    """Internal iCal item.
+
+    The text of an item is a slice of a buffer shared by all the items of a
+    calendar, it is only copied when it is requested. Properties of the first
+    component are indexed on first access.
+
+    """
+    __slots__ = (
+        "_buffer", "_start", "_end", "_name", "_component", "_properties",
+        "_dates", "_parts")
+
+    def __init__(self, text, name=None, start=0, end=None):
+        """Initialize object from ``text`` and different ``kwargs``.
+
+        If ``start`` or ``end`` are given, the item is the slice of ``text``
+        between these offsets.
+
+        """
+        self._buffer = text
+        self._start = start
+        self._end = len(text) if end is None else end
         self._name = name
-        self._dtstart = self._rrule = self._dtend = None
-        
-        # Extract important data to expand events
-        inevent = False
-        for line in self.text.splitlines():
-            if line.startswith("BEGIN:VEVENT"):
-                inevent = True
-            elif line.startswith("END:VEVENT"):
-                break
-            elif inevent:
-                if line.startswith("DTSTART"):
-                    self._dtstart = self._parseDate(line)
-                elif line.startswith("DTEND"):
-                    self._dtend = self._parseDate(line)
-                elif line.startswith("RRULE:"):
-                    self._rrule = Rrule(line.replace("RRULE:", "").strip())
-
-        # We must synchronize the name in the text and in the object.
-        # An item must have a name, determined in order by:
-        #
-        # - the ``name`` parameter
-        # - the ``X-RADICALE-NAME`` iCal property (for Events, Todos, Journals)
-        # - the ``UID`` iCal property (for Events, Todos, Journals)
-        # - the ``TZID`` iCal property (for Timezones)
+        self._component = self._properties = self._dates = None
+        self._parts = None
+
         if not self._name:
-            for line in unfold(self.text):
-                if line.startswith("X-RADICALE-NAME:"):
-                    self._name = line.replace("X-RADICALE-NAME:", "").strip()
-                    break
-                elif line.startswith("TZID:"):
-                    self._name = line.replace("TZID:", "").strip()
-                    break
-                elif line.startswith("UID:"):
-                    self._name = line.replace("UID:", "").strip()
-                    # Do not break, a ``X-RADICALE-NAME`` can appear next
-
-        if self._name:
-            if "\nX-RADICALE-NAME:" in text:
-                for line in unfold(self.text):
-                    if line.startswith("X-RADICALE-NAME:"):
-                        self.text = self.text.replace(
-                            line, "X-RADICALE-NAME:%s" % self._name)
+            name_lines, tzid, uid = self._names()
+            # An item must have a name, determined in order by:
+            #
+            # - the ``name`` parameter
+            # - the ``X-RADICALE-NAME`` iCal property (for Events, Todos,
+            #   Journals)
+            # - the ``TZID`` iCal property (for Timezones)
+            # - the ``UID`` iCal property (for Events, Todos, Journals)
+            #
+            # Items with none of them get a name derived from their text.
+            self._name = (name_lines[0][1] if name_lines else tzid or uid)
+
+    def _names(self):
+        """Find the properties giving the name of the item.
+
+        Return the list of ``(line, value)`` of the ``X-RADICALE-NAME``
+        properties, the first ``TZID`` and the last ``UID``.
+
+        """
+        name_lines = []
+        tzid = uid = None
+        for match in NAME_REGEX.finditer(self._buffer, self._start, self._end):
+            key, value = match.groups()
+            if key == "X-RADICALE-NAME":
+                name_lines.append(
+                    (match.group(0), _unfold_text(value).strip()))
+            elif key == "TZID":
+                if tzid is None:
+                    tzid = _unfold_text(value).strip()
             else:
-                self.text = self.text.replace(
-                    "\nUID:", "\nX-RADICALE-NAME:%s\nUID:" % self._name)
-        else:
-            self._name = str(uuid.uuid4())
-            self.text = self.text.replace(
-                "\nEND:", "\nUID:%s\nEND:" % self._name)
-
-    def _parseDate(self, line):
-        """Parses ical datetime
-        
-        @rtype:     datetime
-        @return:    
+                uid = _unfold_text(value).strip()
+        return name_lines, tzid, uid
+
+    def normalize(self):
+        """Return the item with its name stored in its text.
+
+        Items are normalized once, when they are written: the
+        ``X-RADICALE-NAME`` property is synchronized with the name of the
+        item, and a UID is generated for the items without name. Reading the
+        stored items then never changes their text, nor their names. Named
+        items without UID, except timezones, get both an ``X-RADICALE-NAME``
+        and a new UID.
+
         """
-        # TODO: Use timezone (DTSTART;Europe/Madrid:20111017T180000)
-        dates = line.split(":")
-        if not line.endswith("Z"):
-            d = datetime.strptime(dates[1],'%Y%m%dT%H%M%S')
+        name_lines, tzid, uid = self._names()
+        text = original_text = self.text
+        name = self._name
+        if name:
+            name_line = "X-RADICALE-NAME:%s" % name
+            if name_lines:
+                for line, value in name_lines:
+                    if value != name:
+                        text = text.replace(line, name_line)
+            elif uid is not None:
+                text = text.replace("\nUID:", "\n%s\nUID:" % name_line)
+            elif name != tzid:
+                # Timezones are named by their TZID, they are kept unchanged
+                index = text.rfind("\nEND:")
+                text = "%s\n%s\nUID:%s%s" % (
+                    text[:index], name_line, uuid.uuid4(), text[index:])
         else:
-            d = datetime.strptime(dates[1],'%Y%m%dT%H%M%SZ')
+            name = str(uuid.uuid4())
+            index = text.rfind("\nEND:")
+            text = "%s\nUID:%s%s" % (text[:index], name, text[index:])
+        if text is original_text:
+            return self
+        return type(self)(text, name)
+
+    @property
+    def text(self):
+        """Item as plain text."""
+        if self._start == 0 and self._end == len(self._buffer):
+            return self._buffer
+        return self._buffer[self._start:self._end]
+
+    @text.setter
+    def text(self, text):
+        """Set the text of the item, replacing the shared buffer."""
+        self._buffer = text
+        self._start = 0
+        self._end = len(text)
+
+    def _index(self):
+        """Index the properties of the first component."""
+        self._properties = {}
+        depth = 0
+        for line in unfold(self.text):
+            if line.startswith("BEGIN:"):
+                depth += 1
+                if depth == 1:
+                    self._component = line[6:].strip()
+            elif line.startswith("END:"):
+                depth -= 1
+                if depth == 0:
+                    break
+            elif depth == 1:
+                prop = Property(line)
+                self._properties.setdefault(prop.name.upper(), []).append(prop)
+
+    @property
+    def properties(self):
+        """Dict of the lists of properties of the first component.
+
+        Keys are property names in upper case, properties of sub-components
+        (alarms for example) are not included.
+
+        """
+        if self._properties is None:
+            self._index()
+        return self._properties
+
+    @property
+    def component(self):
+        """Name of the first component, ``None`` for headers."""
+        if self._properties is None:
+            self._index()
+        return self._component
+
+    def get_property(self, name):
+        """Get the first property called ``name``, ``None`` if missing."""
+        properties = self.properties.get(name.upper())
+        return properties[0] if properties else None
+
+    def get(self, name, default=None):
+        """Get the value of the first property called ``name``."""
+        prop = self.get_property(name)
+        return default if prop is None else prop.value
+
+    def replace_properties(self, changes):
+        """Return a new item with the properties in ``changes`` replaced.
+
+        ``changes`` is a dict whose keys are upper case property names and
+        values are new content lines, or ``None`` to remove the properties.
+        Missing properties are added. Changes apply to the top-level
+        components of the item, not to their sub-components.
 
-        return d
+        """
+        lines = []
+        depth = 0
+        for line in unfold(self.text):
+            if line.startswith("BEGIN:"):
+                depth += 1
+                lines.append(line)
+                if depth == 1:
+                    missing = set(
+                        key for key, value in changes.items() if value)
+                    insert_at = len(lines)
+                continue
+            elif line.startswith("END:"):
+                depth -= 1
+                if depth == 0:
+                    lines[insert_at:insert_at] = [
+                        changes[key] for key in sorted(missing)]
+            elif depth == 1:
+                key = split_line(line)[0].upper()
+                if key in changes:
+                    if key in missing:
+                        lines.append(changes[key])
+                        missing.remove(key)
+                    continue
+            lines.append(line)
+        return type(self)("\n".join(lines), self._name)
+
+    @property
+    def tzids(self):
+        """Set of the TZIDs used by the properties of the item."""
+        return set(
+            tzid.strip('"') for tzid in
+            TZID_REGEX.findall(self._buffer, self._start, self._end))
+
+    @property
+    def parts(self):
+        """List of the top-level components of the item, as items.
+
+        A recurring component and the overrides of its occurrences, sharing
+        the same UID, are parts of the same item.
+
+        """
+        if self._parts is None:
+            spans = list(_spans(self._buffer, None, self._start, self._end))
+            if len(spans) > 1:
+                self._parts = [
+                    type(self)(self._buffer, self._name, start, end)
+                    for _, start, end in spans]
+            else:
+                self._parts = ()
+        return self._parts or [self]
+
+    @property
+    def master(self):
+        """Part of the item without ``RECURRENCE-ID``, or its first part."""
+        parts = self.parts
+        for part in parts:
+            if part.get_property("RECURRENCE-ID") is None:
+                return part
+        return parts[0]
+
+    @property
+    def overrides(self):
+        """Dict of the parts overriding occurrences, by ``RECURRENCE-ID``."""
+        overrides = {}
+        for part in self.parts:
+            recurrence_id = part.get("RECURRENCE-ID")
+            if recurrence_id is not None:
+                overrides[parse_date(recurrence_id.strip())] = part
+        return overrides
+
+    def _parse_dates(self):
+        """Parse and store the dates and the rrule of events."""
+        dtstart = dtend = rrule = None
+        master = self.master
+        if master.component == "VEVENT":
+            dtstart = master.get_property("DTSTART")
+            dtend = master.get_property("DTEND")
+            rrule = master.get("RRULE")
+            dtstart = parse_date(dtstart.value.strip()) if dtstart else None
+            dtend = parse_date(dtend.value.strip()) if dtend else None
+            rrule = Rrule(rrule.strip()) if rrule else None
+        self._dates = dtstart, dtend, rrule
 
     @property
     def etag(self):
         """Item etag.
 
-        Etag is mainly used to know if an item has changed.
+        Etag is mainly used to know if an item has changed. It is a digest
+        of the text, the same in all the processes.
 
         """
-        return '"%s"' % hash(self.text)
+        return '"%s"' % hashlib.md5(self.text.encode("utf-8")).hexdigest()
 
     @property
     def name(self):
@@ -174,38 +514,50 @@ class Item(object):
         Name is mainly used to give an URL to the item.
 
         """
+        if not self._name:
+            # Stable name of an item stored without name nor UID
+            return hashlib.md5(self.text.encode("utf-8")).hexdigest()
         return self._name
 
     @property
     def dtstart(self):
         """Item dtstart.
         """
-        return self._dtstart
+        if self._dates is None:
+            self._parse_dates()
+        return self._dates[0]
 
     @property
     def dtend(self):
         """Item dtend.
         """
-        return self._dtend
+        if self._dates is None:
+            self._parse_dates()
+        return self._dates[1]
 
     @property
     def rrule(self):
         """Item rrule.
         """
-        return self._rrule
+        if self._dates is None:
+            self._parse_dates()
+        return self._dates[2]
 
 
 class Header(Item):
     """Internal header class."""
+    __slots__ = ()
 
 
 class Event(Item):
     """Internal event class."""
+    __slots__ = ()
     tag = "VEVENT"
 
 
 class Todo(Item):
     """Internal todo class."""
+    __slots__ = ()
     # This is not a TODO!
     # pylint: disable=W0511
     tag = "VTODO"
@@ -214,14 +566,59 @@ class Todo(Item):
 
 class Journal(Item):
     """Internal journal class."""
+    __slots__ = ()
     tag = "VJOURNAL"
 
 
 class Timezone(Item):
     """Internal timezone class."""
+    __slots__ = ()
     tag = "VTIMEZONE"
 
 
+def _file_version(path):
+    """Return the version of the file at ``path``, ``None`` if missing.
+
+    The version changes each time the file is modified, including by other
+    processes: it is built from the nanosecond modification and change times
+    where available, the inode changed when the file is replaced, and the
+    size of the file.
+
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (
+        getattr(stat, "st_mtime_ns", stat.st_mtime),
+        getattr(stat, "st_ctime_ns", stat.st_ctime),
+        stat.st_ino, stat.st_size)
+
+
+class _CachedCalendar(object):
+    """Text and parsed items of a version of a calendar file."""
+    __slots__ = ("version", "text", "headers", "items")
+
+    def __init__(self, version, text):
+        """Initialize the entry of the calendar ``text`` at ``version``."""
+        self.version = version
+        self.text = text
+        self.headers = None
+        # Lists of items, by tuple of item types
+        self.items = {}
+
+    @staticmethod
+    def evict():
+        """Remove the least recently used entries exceeding ``CACHE_SIZE``.
+
+        ``_CACHE_LOCK`` must be acquired.
+
+        """
+        size = sum(len(entry.text) for entry in _CACHE.values())
+        while size > CACHE_SIZE:
+            size -= len(_CACHE.pop(next(iter(_CACHE))).text)
+
+
 class Calendar(object):
     """Internal calendar class."""
     tag = "VCALENDAR"
@@ -308,40 +705,44 @@ class Calendar(object):
 
         If ``name`` is given, give this name to new items in ``text``.
 
-        Return a list of items.
+        Return a list of normalized items, ready to be written.
+
+        """
+        with metrics.phase("parse", "parse_duration_seconds"):
+            return [item.normalize() for item in Calendar._parse_items(
+                _normalize_newlines(text), item_types, name)]
+
+    @staticmethod
+    def _parse_items(text, item_types, name=None):
+        """Find items with type in ``item_types`` in ``text``.
+
+        Items are slices of ``text``, whose newlines must be normalized.
+        Components sharing the same name, as a recurring event and its
+        overridden occurrences, are grouped in one item.
 
         """
         item_tags = {}
         for item_type in item_types:
             item_tags[item_type.tag] = item_type
 
-        items = {}
-
-        lines = unfold(text)
-        in_item = False
-
-        for line in lines:
-            if line.startswith("BEGIN:") and not in_item:
-                item_tag = line.replace("BEGIN:", "").strip()
-                if item_tag in item_tags:
-                    in_item = True
-                    item_lines = []
-
-            if in_item:
-                item_lines.append(line)
-                if line.startswith("END:%s" % item_tag):
-                    in_item = False
-                    item_type = item_tags[item_tag]
-                    item_text = "\n".join(item_lines)
-                    item_name = None if item_tag == "VTIMEZONE" else name
-                    item = item_type(item_text, item_name)
-                    if item.name in items:
-                        text = "\n".join((item.text, items[item.name].text))
-                        items[item.name] = item_type(text, item.name)
-                    else:
-                        items[item.name] = item
-
-        return list(items.values())
+        # Lists of components, by name
+        groups = OrderedDict()
+        for item_tag, start, end in _spans(text, item_tags):
+            item_name = None if item_tag == "VTIMEZONE" else name
+            item = item_tags[item_tag](text, item_name, start, end)
+            groups.setdefault(item.name, []).append(item)
+
+        items = []
+        for item_name, parts in groups.items():
+            if len(parts) == 1:
+                item = parts[0]
+                item._parts = ()
+            else:
+                item = type(parts[0])(
+                    "\n".join(part.text for part in parts), item_name)
+                item._parts = parts
+            items.append(item)
+        return items
 
     def get_item(self, name):
         """Get calendar item called ``name``."""
@@ -388,6 +789,10 @@ class Calendar(object):
         self._create_dirs(self.path)
 
         text = serialize(headers, items)
+        metrics.increment("storage_writes_total")
+        metrics.increment("storage_written_characters_total", len(text))
+        with _CACHE_LOCK:
+            _CACHE.pop(self.path, None)
         return open(self.path, "w").write(text)
 
     @staticmethod
@@ -399,7 +804,7 @@ class Calendar(object):
     @property
     def etag(self):
         """Etag from calendar."""
-        return '"%s"' % hash(self.text)
+        return '"%s"' % hashlib.md5(self.text.encode("utf-8")).hexdigest()
 
     @property
     def name(self):
@@ -409,57 +814,117 @@ class Calendar(object):
                 self.path.split(os.path.sep)[-1])
 
     @property
-    def text(self):
-        """Calendar as plain text."""
+    def version(self):
+        """Version of the calendar file, ``None`` if it does not exist.
+
+        The version changes each time the file is modified.
+
+        """
+        return _file_version(self.path)
+
+    @property
+    def props_version(self):
+        """Version of the properties file, ``None`` if it does not exist."""
+        return _file_version(self.path + ".props")
+
+    def _cached(self):
+        """Get the cache entry of the current version of the calendar.
+
+        Return ``None`` if the calendar file does not exist.
+
+        """
+        version = self.version
+        if version is None:
+            return None
+        with _CACHE_LOCK:
+            entry = _CACHE.get(self.path)
+            hit = entry is not None and entry.version == version
+            if hit:
+                # Move the entry at the end of the LRU list
+                del _CACHE[self.path]
+                _CACHE[self.path] = entry
+        metrics.cache("calendar", hit)
+        if hit:
+            return entry
+
         try:
-            return open(self.path).read()
+            with metrics.phase("read"):
+                text = open(self.path).read()
         except IOError:
-            return ""
+            return None
+        metrics.increment("storage_reads_total")
+        metrics.increment("storage_read_characters_total", len(text))
+        entry = _CachedCalendar(version, _normalize_newlines(text))
+        if len(text) <= CACHE_SIZE:
+            with _CACHE_LOCK:
+                _CACHE.pop(self.path, None)
+                _CACHE[self.path] = entry
+                _CachedCalendar.evict()
+        return entry
+
+    def _items(self, item_types):
+        """Get the list of the items with type in ``item_types``."""
+        entry = self._cached()
+        if entry is None:
+            return []
+        items = entry.items.get(item_types)
+        if items is None:
+            with metrics.phase("parse", "parse_duration_seconds"):
+                items = [
+                    timezones.register(item) if item.tag == Timezone.tag
+                    else item
+                    for item in self._parse_items(entry.text, item_types)]
+            entry.items[item_types] = items
+        return list(items)
+
+    @property
+    def text(self):
+        """Calendar as plain text."""
+        entry = self._cached()
+        return entry.text if entry is not None else ""
 
     @property
     def headers(self):
         """Find headers items in calendar."""
-        header_lines = []
-
-        lines = unfold(self.text)
-        for line in lines:
-            if line.startswith("PRODID:"):
-                header_lines.append(Header(line))
-        for line in lines:
-            if line.startswith("VERSION:"):
-                header_lines.append(Header(line))
-
-        return header_lines
+        entry = self._cached()
+        if entry is None:
+            return []
+        if entry.headers is None:
+            entry.headers = [
+                Header(_unfold_text(line)) for regex in (
+                    PRODID_REGEX, VERSION_REGEX)
+                for line in regex.findall(entry.text)]
+        return list(entry.headers)
 
     @property
     def items(self):
         """Get list of all items in calendar."""
-        return self._parse(self.text, (Event, Todo, Journal, Timezone))
+        return self._items((Event, Todo, Journal, Timezone))
 
     @property
     def components(self):
         """Get list of all components in calendar."""
-        return self._parse(self.text, (Event, Todo, Journal))
+        return self._items((Event, Todo, Journal))
 
     @property
     def events(self):
         """Get list of ``Event`` items in calendar."""
-        return self._parse(self.text, (Event,))
+        return self._items((Event,))
 
     @property
     def todos(self):
         """Get list of ``Todo`` items in calendar."""
-        return self._parse(self.text, (Todo,))
+        return self._items((Todo,))
 
     @property
     def journals(self):
         """Get list of ``Journal`` items in calendar."""
-        return self._parse(self.text, (Journal,))
+        return self._items((Journal,))
 
     @property
     def timezones(self):
         """Get list of ``Timezome`` items in calendar."""
-        return self._parse(self.text, (Timezone,))
+        return self._items((Timezone,))
 
     @property
     def last_modified(self):
@@ -485,11 +950,13 @@ class Calendar(object):
         if os.path.exists(props_path):
             with open(props_path) as prop_file:
                 properties.update(json.load(prop_file))
+        old_properties = dict(properties)
         yield properties
-        # On exit
-        self._create_dirs(props_path)
-        with open(props_path, 'w') as prop_file:
-            json.dump(properties, prop_file)
+        # On exit, only write changed properties, keeping the file version
+        if properties != old_properties:
+            self._create_dirs(props_path)
+            with open(props_path, 'w') as prop_file:
+                json.dump(properties, prop_file)
 
     @property
     def owner_url(self):
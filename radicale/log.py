@@ -22,12 +22,24 @@ Radicale logging module.
 Manage logging from a configuration file. For more information, see:
 http://docs.python.org/library/logging.config.html
 
+Records can be written by a background thread, the request threads then only
+put them in a queue.
+
 """
 
+import atexit
 import os
 import sys
 import logging
 import logging.config
+import logging.handlers
+# Manage Python2/3 different modules
+# pylint: disable=F0401
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+# pylint: enable=F0401
 
 from radicale import config
 
@@ -35,6 +47,9 @@ from radicale import config
 LOGGER = logging.getLogger()
 FILENAME = os.path.expanduser(config.get("logging", "config"))
 
+# Background writer of the asynchronous logging
+_LISTENER = None
+
 
 def start():
     """Start the logging according to the configuration."""
@@ -51,3 +66,44 @@ def start():
         LOGGER.setLevel(logging.DEBUG)
         for handler in LOGGER.handlers:
             handler.setLevel(logging.DEBUG)
+
+    if config.getboolean("logging", "asynchronous"):
+        # QueueListener appears in Python 3.2, its respect_handler_level
+        # parameter in Python 3.5
+        if sys.version_info >= (3, 5):
+            _start_listener(LOGGER.handlers[:])
+            LOGGER.handlers = [logging.handlers.QueueHandler(_LISTENER.queue)]
+            atexit.register(stop)
+            if hasattr(os, "register_at_fork"):
+                # The writer thread is not copied in forked processes
+                os.register_at_fork(after_in_child=_restart_listener)
+        else:
+            LOGGER.warning(
+                "Asynchronous logging is not available, logging synchronously")
+
+
+def _start_listener(handlers):
+    """Start a thread writing the queued records with ``handlers``."""
+    global _LISTENER  # pylint: disable=W0603
+    _LISTENER = logging.handlers.QueueListener(
+        queue.Queue(), *handlers, respect_handler_level=True)
+    _LISTENER.start()
+
+
+def _restart_listener():
+    """Start a new writer thread and queue in a forked process."""
+    if _LISTENER is not None:
+        _start_listener(_LISTENER.handlers)
+        for handler in LOGGER.handlers:
+            if isinstance(handler, logging.handlers.QueueHandler):
+                handler.queue = _LISTENER.queue
+
+
+def stop():
+    """Write the pending records and flush the handlers."""
+    global _LISTENER  # pylint: disable=W0603
+    if _LISTENER is not None:
+        _LISTENER.stop()
+        _LISTENER = None
+    for handler in LOGGER.handlers:
+        handler.flush()
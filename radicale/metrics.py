@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Radicale Server - Calendar Server
+# Copyright © 2011 Guillaume Ayoub
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Radicale metrics module.
+
+Count events and measure durations, export them using the Prometheus text
+format. Metrics are kept per process, nothing is recorded if they are not
+enabled in the configuration.
+
+When the server runs multiple worker processes, each scrape is answered by
+one of them: the metrics of each worker are labelled with its number, and
+must be summed over the ``worker`` label. A restarted worker keeps the
+number of the worker it replaces, its counters start again from zero.
+
+The time spent in the different phases of a request can also be traced, to
+find where slow requests spend their time.
+
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from radicale import config
+
+
+ENABLED = config.getboolean("metrics", "enabled")
+PATH = config.get("metrics", "path")
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Names, types and descriptions of the exported metrics
+METRICS = {
+    "requests_total": ("counter", "Requests answered"),
+    "request_duration_seconds": ("histogram", "Time spent answering requests"),
+    "request_bytes_total": ("counter", "Bytes of request bodies"),
+    "response_bytes_total": ("counter", "Bytes of response bodies"),
+    "storage_reads_total": ("counter", "Calendar files read"),
+    "storage_read_characters_total": (
+        "counter", "Characters read from calendar files"),
+    "storage_writes_total": ("counter", "Calendar files written"),
+    "storage_written_characters_total": (
+        "counter", "Characters written to calendar files"),
+    "parse_duration_seconds": ("histogram", "Time spent parsing calendars"),
+    "cache_requests_total": ("counter", "Cache lookups, hits and misses"),
+    "acl_duration_seconds": (
+        "histogram", "Time spent waiting for the authentication backend")}
+
+# Methods used as labels, other methods are grouped to bound the labels
+METHODS = (
+    "DELETE", "GET", "HEAD", "MKCALENDAR", "MOVE", "OPTIONS", "PROPFIND",
+    "PROPPATCH", "PUT", "REPORT")
+
+# Number of the current worker process, ``None`` without workers
+WORKER = None
+
+_LOCK = threading.Lock()
+_COUNTERS = {}
+_HISTOGRAMS = {}
+
+# Phases of the request processed by the current thread
+_LOCAL = threading.local()
+
+
+def _key(name, labels):
+    """Get the key of the metric called ``name`` with ``labels``."""
+    return name, tuple(sorted(labels.items()))
+
+
+def increment(name, value=1, **labels):
+    """Add ``value`` to the counter called ``name`` with ``labels``."""
+    if ENABLED:
+        key = _key(name, labels)
+        with _LOCK:
+            _COUNTERS[key] = _COUNTERS.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """Add ``value`` to the histogram called ``name`` with ``labels``."""
+    if ENABLED:
+        key = _key(name, labels)
+        with _LOCK:
+            histogram = _HISTOGRAMS.get(key)
+            if histogram is None:
+                # One count per bucket, then the +Inf count and the sum
+                histogram = _HISTOGRAMS[key] = [0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram[i] += 1
+                    break
+            else:
+                histogram[-2] += 1
+            histogram[-1] += value
+
+
+@contextmanager
+def timer(name, **labels):
+    """Add the duration of the ``with`` block to the histogram ``name``."""
+    start = time.time()
+    try:
+        yield
+    finally:
+        observe(name, time.time() - start, **labels)
+
+
+@contextmanager
+def phase(name, metric=None):
+    """Add the duration of the ``with`` block to the request phase ``name``.
+
+    Only the time spent in the block itself is added: the time spent in the
+    phases nested in the block is not counted twice. If ``metric`` is given,
+    the same duration is added to this histogram too.
+
+    """
+    stack = getattr(_LOCAL, "stack", None)
+    if stack is None:
+        stack = _LOCAL.stack = []
+    # Time spent in the nested phases
+    stack.append(0)
+    start = time.time()
+    try:
+        yield
+    finally:
+        duration = time.time() - start
+        own_duration = duration - stack.pop()
+        if stack:
+            stack[-1] += duration
+        phases = getattr(_LOCAL, "phases", None)
+        if phases is not None:
+            phases[name] = phases.get(name, 0) + own_duration
+        if metric:
+            observe(metric, own_duration)
+
+
+def start_tracing():
+    """Start tracing the phases of the request of the current thread."""
+    _LOCAL.phases = {}
+
+
+def stop_tracing():
+    """Stop tracing the current request, return the duration of its phases."""
+    phases = getattr(_LOCAL, "phases", None) or {}
+    _LOCAL.phases = None
+    return phases
+
+
+def cache(name, hit):
+    """Count a lookup in the cache called ``name``."""
+    increment(
+        "cache_requests_total", cache=name, result="hit" if hit else "miss")
+
+
+def request(method, status, bytes_in, bytes_out, duration):
+    """Record an answered request."""
+    if ENABLED:
+        if method not in METHODS:
+            method = "other"
+        increment("requests_total", method=method, status=status)
+        observe(
+            "request_duration_seconds", duration, method=method, status=status)
+        increment("request_bytes_total", bytes_in)
+        increment("response_bytes_total", bytes_out)
+
+
+def _labels(labels, extra=()):
+    """Format ``labels`` for the Prometheus text format."""
+    labels = tuple(labels) + tuple(extra)
+    if WORKER is not None:
+        labels = (("worker", WORKER),) + labels
+    if not labels:
+        return ""
+    return "{%s}" % ",".join(
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace(
+            '"', '\\"').replace("\n", "\\n"))
+        for name, value in labels)
+
+
+def export():
+    """Return the metrics using the Prometheus text format."""
+    with _LOCK:
+        counters = dict(_COUNTERS)
+        histograms = dict((key, list(value))
+                          for key, value in _HISTOGRAMS.items())
+
+    lines = []
+    for name in sorted(METRICS):
+        metric_type, description = METRICS[name]
+        full_name = "radicale_%s" % name
+        lines.append("# HELP %s %s" % (full_name, description))
+        lines.append("# TYPE %s %s" % (full_name, metric_type))
+        if metric_type == "counter":
+            for (key_name, labels), value in sorted(counters.items()):
+                if key_name == name:
+                    lines.append("%s%s %s" % (
+                        full_name, _labels(labels), value))
+        else:
+            for (key_name, labels), value in sorted(histograms.items()):
+                if key_name != name:
+                    continue
+                total = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), value[:-1]):
+                    total += count
+                    lines.append("%s_bucket%s %s" % (
+                        full_name, _labels(labels, (("le", bound),)), total))
+                lines.append("%s_sum%s %s" % (
+                    full_name, _labels(labels), value[-1]))
+                lines.append("%s_count%s %s" % (
+                    full_name, _labels(labels), total))
+    lines.append("")
+    return "\n".join(lines)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Radicale Server - Calendar Server
+# Copyright © 2011 Guillaume Ayoub
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Radicale process pool.
+
+Run CPU-heavy work, as the parsing and the expansion of large calendars, in
+a pool of processes. The threads serving the other requests are then not
+slowed down by the global interpreter lock.
+
+The pool is forked before the threads serving the requests are started, by
+``radicale.py`` or by the WSGI scripts calling ``start``: work is never given
+to the pool if it has not been started. Each worker process has its own pool.
+
+"""
+
+import atexit
+import multiprocessing
+import os
+import signal
+import threading
+
+from radicale import config, log
+
+
+PROCESSES = config.getint("server", "report_processes")
+OFFLOAD_SIZE = config.getint("server", "report_offload_size")
+
+_POOL = None
+_POOL_PID = None
+_LOCK = threading.Lock()
+
+# ``True`` in the processes of the pool
+_IN_POOL = False
+
+
+def _initialize():
+    """Initialize a process of the pool."""
+    global _IN_POOL
+    _IN_POOL = True
+    # The server handles the interruptions
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _context():
+    """Return the multiprocessing context used to start the pool.
+
+    Processes are forked where possible: they get the configuration, the
+    loaded modules and the hash seed of the server.
+
+    """
+    # Contexts appear in Python 3.4, processes are always forked before
+    if not hasattr(multiprocessing, "get_context"):
+        return multiprocessing
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+def start():
+    """Start the pool of the current process, if enabled and not started.
+
+    The pool must be started before any thread, forked processes only get
+    the calling thread and may copy locks held by the others.
+
+    """
+    global _POOL, _POOL_PID
+    with _LOCK:
+        # A pool copied by ``fork`` belongs to the parent process
+        if PROCESSES <= 0 or _IN_POOL or _POOL_PID == os.getpid():
+            return
+        _POOL = _context().Pool(PROCESSES, _initialize)
+        _POOL_PID = os.getpid()
+    log.LOGGER.debug("Process pool started with %i processes" % PROCESSES)
+
+
+def stop():
+    """Stop the pool of the current process."""
+    global _POOL, _POOL_PID
+    if _POOL is not None and _POOL_PID == os.getpid():
+        _POOL.terminate()
+        _POOL.join()
+        log.LOGGER.debug("Process pool stopped")
+    _POOL = _POOL_PID = None
+
+
+def offload(cost):
+    """Return if a work of ``cost`` must be given to the pool.
+
+    ``cost`` is compared to the ``report_offload_size`` option. Work is not
+    given to a pool that has not been started by the current process.
+
+    """
+    return _POOL_PID == os.getpid() and not _IN_POOL and cost >= OFFLOAD_SIZE
+
+
+def run(function, *args):
+    """Call ``function`` with ``args`` in the pool, return its result.
+
+    The calling thread waits for the result without holding the global
+    interpreter lock. Exceptions are raised again in the calling thread.
+
+    """
+    return _POOL.apply_async(function, args).get()
+
+
+atexit.register(stop)
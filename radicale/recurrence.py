@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Radicale Server - Calendar Server
+# Copyright © 2011 Guillaume Ayoub
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Radicale recurrence expansion.
+
+Expand recurring events into their occurrences. The recurrence set of an
+event is built once from its ``RRULE``, ``RDATE`` and ``EXDATE`` properties,
+and the text of the occurrences is generated from a template of the master
+event, where only ``DTSTART``, ``DTEND`` and ``RECURRENCE-ID`` change.
+Overridden occurrences are given as they are stored.
+
+Read rfc5545-3.8.5 and rfc4791-9.6.5 for info.
+
+"""
+
+import re
+from datetime import datetime, timedelta
+
+from dateutil.rrule import rruleset, rrulestr
+
+from radicale import config, ical, log, timezones
+
+
+# Maximum number of occurrences of a recurring event in an expanded answer
+MAX_INSTANCES = config.getint("server", "max_instances")
+
+# Maximum number of occurrences of a recurring event skipped before a time
+# range, the later occurrences are not searched
+MAX_SKIPPED = 100 * MAX_INSTANCES
+
+# Maximum offset of a timezone
+MAX_OFFSET = timedelta(days=1)
+
+# Properties of the master event not copied to its occurrences
+RECURRENCE_PROPERTIES = (
+    "DTSTART", "DTEND", "RECURRENCE-ID", "RRULE", "RDATE", "EXDATE",
+    "EXRULE")
+
+DURATION_REGEX = re.compile(
+    r"^([+-])?P(?:(\d+)W)?(?:(\d+)D)?"
+    r"(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+
+
+def parse_duration(value):
+    """Return the timedelta of an iCal DURATION ``value``.
+
+    Read rfc5545-3.3.6 for info.
+
+    """
+    match = DURATION_REGEX.match(value.strip())
+    if match is None:
+        raise ValueError("Invalid duration: %s" % value)
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    duration = timedelta(
+        weeks=int(weeks or 0), days=int(days or 0), hours=int(hours or 0),
+        minutes=int(minutes or 0), seconds=int(seconds or 0))
+    return -duration if sign == "-" else duration
+
+
+def duration(component):
+    """Return the duration of the event ``component``.
+
+    The duration is given by ``DTEND`` or ``DURATION``, events without them
+    last one day if they start on a date, and no time otherwise.
+
+    """
+    dtstart = component.get_property("DTSTART")
+    if component.dtend is not None:
+        return component.dtend - component.dtstart
+    value = component.get("DURATION")
+    if value is not None:
+        return parse_duration(value)
+    if dtstart is not None and len(dtstart.value.strip()) == 8:
+        return timedelta(days=1)
+    return timedelta(0)
+
+
+def tzinfo(component, known=None):
+    """Return the tzinfo of the start date of ``component``.
+
+    ``None`` is returned for UTC, floating and unknown timezones. ``known``
+    is a dict of tzinfos by TZID, given by ``timezones.tzinfos``.
+
+    """
+    prop = component.get_property("DTSTART")
+    if prop is None or prop.value.strip().endswith("Z"):
+        return None
+    tzid = prop.params.get("TZID")
+    return timezones.lookup(tzid, known) if tzid else None
+
+
+def period(component, known=None):
+    """Return the UTC start and end dates of ``component``.
+
+    Return ``None`` if the component has no start date.
+
+    """
+    dtstart = component.dtstart
+    if dtstart is None:
+        return None
+    component_tzinfo = tzinfo(component, known)
+    return (
+        timezones.to_utc(dtstart, component_tzinfo),
+        timezones.to_utc(dtstart + duration(component), component_tzinfo))
+
+
+def overlaps(dtstart, dtend, start, end):
+    """Return if the ``dtstart``-``dtend`` period overlaps a time range.
+
+    ``start`` and ``end`` are the limits of the range, ``None`` for open
+    ranges. All the dates are in UTC.
+
+    """
+    if end is not None and dtstart >= end:
+        return False
+    if start is not None:
+        if dtend > dtstart:
+            return dtend > start
+        return dtstart >= start
+    return True
+
+
+def _dates(properties):
+    """Return the dates listed in the values of date ``properties``.
+
+    Periods are given by their start dates.
+
+    """
+    return [
+        ical.parse_date(value.split("/")[0].strip())
+        for prop in properties for value in prop.value.split(",")
+        if value.strip()]
+
+
+class Series(object):
+    """Recurring event, with its recurrence set and its overrides."""
+    def __init__(self, item, known=None):
+        """Build the recurrence set of ``item``.
+
+        ``known`` is a dict of tzinfos by TZID, given by
+        ``timezones.tzinfos``.
+
+        """
+        master = item.master
+        self.name = item.name
+        self.master = master
+        self.overrides = item.overrides
+        self.dtstart = item.dtstart
+        self.duration = duration(master)
+        self.tzinfo = tzinfo(master, known)
+        self.known = known
+
+        self.rruleset = rruleset()
+        self.rruleset.rdate(self.dtstart)
+        try:
+            recurrence_rule = rrulestr(
+                item.rrule.rrule, dtstart=self.dtstart, ignoretz=True)
+            rdates = _dates(master.properties.get("RDATE", ()))
+            exdates = _dates(master.properties.get("EXDATE", ()))
+        except (ValueError, TypeError) as exception:
+            # The event is kept as a single event
+            log.LOGGER.warning(
+                "Invalid recurrence of %s: %s", self.name, exception)
+        else:
+            self.rruleset.rrule(recurrence_rule)
+            for date in rdates:
+                self.rruleset.rdate(date)
+            for date in exdates:
+                self.rruleset.exdate(date)
+
+        self._dtstart_property = master.get_property("DTSTART")
+        self._dtend_property = master.get_property("DTEND")
+        # Template of the occurrences, built when the first one is generated
+        self._head = self._body = None
+
+    @staticmethod
+    def _template(master):
+        """Return the first line and the other lines of the occurrences.
+
+        Lines of the recurrence properties are removed.
+
+        """
+        lines = ical.unfold(master.text)
+        body = []
+        depth = 0
+        for line in lines:
+            if line.startswith("BEGIN:"):
+                depth += 1
+            elif line.startswith("END:"):
+                depth -= 1
+            elif depth == 1 and ical.split_line(line)[0].upper() in \
+                    RECURRENCE_PROPERTIES:
+                continue
+            body.append(line)
+        return body[0], "\n".join(body[1:])
+
+    @staticmethod
+    def _date_line(prop, date, name=None):
+        """Return a content line like ``prop`` with ``date`` as value."""
+        return "%s%s:%s" % (
+            name or prop.name, prop.params_text,
+            ical.format_date(date, prop.value.strip()))
+
+    def occurrence(self, dtstart):
+        """Return the event of the occurrence starting at ``dtstart``."""
+        if self._head is None:
+            self._head, self._body = self._template(self.master)
+        lines = [self._head, self._date_line(self._dtstart_property, dtstart)]
+        if self._dtend_property is not None:
+            lines.append(self._date_line(
+                self._dtend_property, dtstart + self.duration))
+        lines.append(self._date_line(
+            self._dtstart_property, dtstart, "RECURRENCE-ID"))
+        lines.append(self._body)
+        return type(self.master)("\n".join(lines), self.name)
+
+    def _starts(self, start, end):
+        """Find the generated occurrences overlapping the time range.
+
+        Return an iterator on the ``(dtstart, utc)`` tuples of their local
+        and UTC start dates. Overridden occurrences are skipped. The search
+        stops after ``MAX_SKIPPED`` occurrences before the time range.
+
+        """
+        # Occurrences starting before this local date end before the range,
+        # whatever the offset of their timezone
+        first = start - self.duration - MAX_OFFSET if start else None
+        skipped = 0
+        for dtstart in self.rruleset:
+            if first is not None and dtstart < first:
+                skipped += 1
+                if skipped >= MAX_SKIPPED:
+                    log.LOGGER.warning(
+                        "Search of the occurrences of %s stopped after %i "
+                        "occurrences", self.name, MAX_SKIPPED)
+                    return
+                continue
+            utc = timezones.to_utc(dtstart, self.tzinfo)
+            if end is not None and utc >= end:
+                return
+            if dtstart in self.overrides:
+                continue
+            utc_end = timezones.to_utc(dtstart + self.duration, self.tzinfo) \
+                if self.duration else utc
+            if overlaps(utc, utc_end, start, end):
+                yield dtstart, utc
+
+    def _overrides(self, start, end):
+        """Return the ``(utc, override)`` tuples of the overrides in range."""
+        overrides = []
+        for override in self.overrides.values():
+            override_period = period(override, self.known)
+            if override_period and overlaps(
+                    override_period[0], override_period[1], start, end):
+                overrides.append((override_period[0], override))
+        return overrides
+
+    def matches(self, start, end):
+        """Return if an occurrence overlaps the ``start``-``end`` range."""
+        for _ in self._starts(start, end):
+            return True
+        return bool(self._overrides(start, end))
+
+    def expand(self, start, end, limit_recurrence_set=False):
+        """Return the occurrences overlapping the ``start``-``end`` range.
+
+        Occurrences are given as a list of ``(utc, item)`` tuples, where
+        ``utc`` is their UTC start date. If ``limit_recurrence_set`` is
+        ``True``, the master event is returned instead of the generated
+        occurrences.
+
+        """
+        occurrences = []
+        if limit_recurrence_set:
+            if self.matches(start, end):
+                occurrences.append((
+                    timezones.to_utc(self.dtstart, self.tzinfo), self.master))
+                occurrences.extend(self._overrides(start, end))
+            return occurrences
+
+        for dtstart, utc in self._starts(start, end):
+            if len(occurrences) >= MAX_INSTANCES:
+                log.LOGGER.warning(
+                    "Expansion of %s stopped after %i occurrences",
+                    self.name, MAX_INSTANCES)
+                break
+            occurrences.append((utc, self.occurrence(dtstart)))
+        occurrences.extend(self._overrides(start, end))
+        return occurrences
+
+
+def expand(items, start, end, limit_recurrence_set=False, known=None):
+    """Expand the recurring events of ``items`` in the ``start``-``end`` range.
+
+    Items that are not recurring are kept if they overlap the range. Return
+    the list of the items, ordered by UTC start date. ``known`` is a dict of
+    tzinfos by TZID, given by ``timezones.tzinfos``.
+
+    """
+    occurrences = []
+    for item in items:
+        if item.rrule:
+            if _after(item, end, known):
+                continue
+            occurrences.extend(Series(item, known).expand(
+                start, end, limit_recurrence_set))
+        else:
+            item_period = period(item, known)
+            if item_period is None:
+                if start is None and end is None:
+                    occurrences.append((datetime.min, item))
+            elif overlaps(item_period[0], item_period[1], start, end):
+                occurrences.append((item_period[0], item))
+    occurrences.sort(key=lambda occurrence: occurrence[0])
+    return [item for _, item in occurrences]
+
+
+def select(items, start, end, known=None):
+    """Return the ``items`` with an occurrence in the ``start``-``end`` range.
+
+    Items without start date are kept. ``known`` is a dict of tzinfos by
+    TZID, given by ``timezones.tzinfos``.
+
+    """
+    selected = []
+    for item in items:
+        if item.rrule:
+            if not _after(item, end, known) and \
+                    Series(item, known).matches(start, end):
+                selected.append(item)
+        else:
+            item_period = period(item, known)
+            if item_period is None or overlaps(
+                    item_period[0], item_period[1], start, end):
+                selected.append(item)
+    return selected
+
+
+def _after(item, end, known):
+    """Return if the recurring ``item`` starts after ``end``.
+
+    Items with overrides, that may be moved before ``end``, never start after.
+
+    """
+    if end is None or len(item.parts) > 1:
+        return False
+    return timezones.to_utc(item.dtstart, tzinfo(item.master, known)) >= end
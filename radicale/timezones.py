@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Radicale Server - Calendar Server
+# Copyright © 2011 Guillaume Ayoub
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Radicale timezones.
+
+Compile the VTIMEZONE components into tzinfo objects, used to compare the
+local dates of the events in UTC.
+
+Timezones are shared by all the calendars of the process, and found by a
+hash of their definition: the same timezone used by many calendars is kept
+once in memory, and compiled once.
+
+"""
+
+import hashlib
+import threading
+# Manage Python2/3 different modules
+# pylint: disable=F0401
+try:
+    from io import StringIO
+except ImportError:
+    from StringIO import StringIO
+# pylint: enable=F0401
+
+from dateutil import tz
+
+from radicale import log
+
+
+UTC = tz.tzutc()
+
+# Maximum number of shared timezones
+_SIZE = 1024
+
+# Shared timezone items and compiled timezones, by hash of their definition
+_REGISTRY = {}
+_TZINFOS = {}
+_LOCK = threading.Lock()
+
+
+def digest(timezone):
+    """Return the hash of the definition of the ``timezone`` item."""
+    return hashlib.md5(timezone.text.encode("utf-8")).hexdigest()
+
+
+def register(timezone):
+    """Return the shared item with the definition of the ``timezone`` item.
+
+    The text of the shared item is kept once for all the calendars.
+
+    """
+    key = digest(timezone)
+    with _LOCK:
+        shared = _REGISTRY.get(key)
+        if shared is None:
+            if len(_REGISTRY) >= _SIZE:
+                _REGISTRY.clear()
+            shared = _REGISTRY[key] = type(timezone)(
+                timezone.text, timezone.name)
+    return shared
+
+
+def used(timezones, items):
+    """Return the ``timezones`` whose TZIDs are used by ``items``."""
+    tzids = set()
+    for item in items:
+        tzids.update(item.tzids)
+    return [timezone for timezone in timezones if timezone.name in tzids]
+
+
+def compile_timezone(timezone):
+    """Return the tzinfo of the ``timezone`` item, ``None`` if invalid."""
+    key = digest(timezone)
+    with _LOCK:
+        if key in _TZINFOS:
+            return _TZINFOS[key]
+    try:
+        tzinfo = tz.tzical(StringIO(timezone.text)).get()
+    except (ValueError, IndexError, KeyError):
+        log.LOGGER.warning("Invalid timezone %s", timezone.name)
+        tzinfo = None
+    with _LOCK:
+        if len(_TZINFOS) >= _SIZE:
+            _TZINFOS.clear()
+        _TZINFOS[key] = tzinfo
+    return tzinfo
+
+
+def tzinfos(timezones):
+    """Return the dict of the tzinfos of the ``timezones`` items, by TZID."""
+    return dict(
+        (timezone.name, compile_timezone(timezone))
+        for timezone in timezones)
+
+
+def lookup(tzid, known=None):
+    """Return the tzinfo of ``tzid``, ``None`` if it is unknown.
+
+    Timezones are searched in the ``known`` dict given by ``tzinfos``, then
+    in the timezone database of the system.
+
+    """
+    tzinfo = (known or {}).get(tzid)
+    if tzinfo is None and tzid and not tzid.startswith("/") and \
+            ".." not in tzid:
+        # Paths are refused, the timezone database is read by name only
+        try:
+            tzinfo = tz.gettz(tzid)
+        except ValueError:
+            tzinfo = None
+    return tzinfo
+
+
+def to_utc(date, tzinfo):
+    """Return the naive UTC datetime of the local ``date`` in ``tzinfo``.
+
+    Dates without timezone are returned as they are.
+
+    """
+    if tzinfo is None:
+        return date
+    return date.replace(tzinfo=tzinfo).astimezone(UTC).replace(tzinfo=None)
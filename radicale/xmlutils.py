@@ -27,8 +27,7 @@ in them for XML requests (all but PUT).
 
 """
 
-from datetime import datetime, timedelta, time, date
-from dateutil.rrule import *
+from datetime import datetime
 try:
     from collections import OrderedDict
 except ImportError:
@@ -37,7 +36,8 @@ except ImportError:
 import re
 import xml.etree.ElementTree as ET
 
-from radicale import client, config, ical
+from radicale import client, config, ical, metrics, pool, recurrence, \
+    timezones
 
 
 NAMESPACES = {
@@ -69,7 +69,7 @@ CLARK_TAG_REGEX = re.compile(r"""
     """, re.VERBOSE)
 
 
-def _pretty_xml(element, level=0):
+def _indent(element, level=0):
     """Indent an ElementTree ``element`` and its children."""
     i = "\n" + level * "  "
     if len(element):
@@ -78,7 +78,7 @@ def _pretty_xml(element, level=0):
         if not element.tail or not element.tail.strip():
             element.tail = i
         for sub_element in element:
-            _pretty_xml(sub_element, level + 1)
+            _indent(sub_element, level + 1)
         # ``sub_element`` is always defined as len(element) > 0
         # pylint: disable=W0631
         if not sub_element.tail or not sub_element.tail.strip():
@@ -87,7 +87,12 @@ def _pretty_xml(element, level=0):
     else:
         if level and (not element.tail or not element.tail.strip()):
             element.tail = i
-    if not level:
+
+
+def _pretty_xml(element):
+    """Indent an ElementTree ``element`` and return it as encoded text."""
+    with metrics.phase("xml"):
+        _indent(element)
         output_encoding = config.get("encoding", "request")
         return ('<?xml version="1.0"?>\n' + ET.tostring(
             element, "utf-8").decode("utf-8")).encode(output_encoding)
@@ -388,6 +393,42 @@ def put(path, ical_request, calendar):
         calendar.append(name, ical_request)
 
 
+def _time_range(element):
+    """Return the ``(start, end)`` UTC dates of a time range ``element``.
+
+    Missing dates are ``None``.
+
+    """
+    return tuple(
+        datetime.strptime(element.get(key), "%Y%m%dT%H%M%SZ")
+        if key in element.keys() else None for key in ("start", "end"))
+
+
+def _report_cost(calendar, expand):
+    """Return the cost of a REPORT request on ``calendar``.
+
+    The cost is the size of the calendar, multiplied by the number of years
+    of the ``expand`` time range when occurrences are expanded.
+
+    """
+    version = calendar.version
+    # The size of the file is the last element of its version
+    cost = version[-1] if version else 0
+    if expand:
+        start, end = expand
+        if start and end:
+            cost *= max(1, (end - start).days / 365.)
+        else:
+            # Open ranges are expanded up to the maximum number of instances
+            cost *= 10
+    return cost
+
+
+def _pooled_report(path, xml_request, calendar_path, principal):
+    """Answer a REPORT request in a process of the pool."""
+    return report(path, xml_request, ical.Calendar(calendar_path, principal))
+
+
 def report(path, xml_request, calendar):
     """Read and answer REPORT requests.
 
@@ -398,16 +439,18 @@ def report(path, xml_request, calendar):
     root = ET.fromstring(xml_request.encode("utf8"))
 
     start = end = None
-    expand = limit_recurrence_set = False
+    # Ranges of the occurrences returned in calendar data, read rfc4791-9.6.5
+    # and rfc4791-9.6.6 for info
+    expand = limit_recurrence_set = None
     prop_element = root.find(_tag("D", "prop"))
     props = []
     for prop in prop_element:
         props.append(prop.tag)
         for child in prop:
             if child.tag == _tag("C", "expand"):
-                expand = True
-            elif child.tag == _tag("C", "expand"):
-                expand = limit_recurrence_set = True
+                expand = _time_range(child)
+            elif child.tag == _tag("C", "limit-recurrence-set"):
+                limit_recurrence_set = _time_range(child)
 
     filter_element = root.find(_tag("C", "filter"))
     if filter_element is not None:
@@ -415,12 +458,13 @@ def report(path, xml_request, calendar):
             for v in c:
                 for filter_ in v:
                     if filter_.tag == _tag("C", "time-range"):
-                        if 'start' in filter_.keys():
-                            start = datetime.strptime(filter_.get('start'),
-                                    '%Y%m%dT%H%M%SZ')
-                        if 'end' in filter_.keys():
-                            end = datetime.strptime(filter_.get('end'),
-                                    '%Y%m%dT%H%M%SZ')
+                        start, end = _time_range(filter_)
+
+    if calendar and pool.offload(_report_cost(calendar, expand)):
+        with metrics.phase("offload"):
+            return pool.run(
+                _pooled_report, path, xml_request,
+                calendar.local_path or ".", calendar.is_principal)
 
     if calendar:
         if root.tag == _tag("C", "calendar-multiget"):
@@ -448,48 +492,21 @@ def report(path, xml_request, calendar):
             path = hreference
             items = calendar.components
 
-        new_items = []
+        if start or end:
+            with metrics.phase("expand"):
+                items = recurrence.select(
+                    items, start, end, timezones.tzinfos(calendar.timezones))
         if expand:
-            # Expand events
-            for item in items:
-                if item.rrule and end:
-                    i = -1
-                    for dtstart in rrulestr(item.rrule.rrule,
-                            dtstart = item.dtstart):
-                        if dtstart >= end:
-                            break
-
-                        if not start or dtstart > start:
-                            i += 1
-                            text = item.text
-                            if i > 0:
-                                text = re.sub(r"RRULE:.*\n",
-                                        r"RECURRENCE-ID:%s\n" % \
-                                        item.dtstart.strftime("%Y%m%dT%H%M%SZ"),
-                                        text)
-                                text = re.sub(r"SUMMARY:(.*)\n",
-                                        r"SUMMARY:\1 (#%d)\n" % (i+1), text)
-
-                            if not limit_recurrence_set:
-                                # Remove rrule line
-                                text = re.sub(r"RRULE:.*\n", "", text)
-
-                            # Update start and end dates
-                            dtend = dtstart + (item.dtend - item.dtstart)
-                            text = re.sub(r"DTSTART:.*\n", "DTSTART:%s\n" % \
-                                    dtstart.strftime("%Y%m%dT%H%M%SZ"), text)
-                            text = re.sub(r"DTEND:.*\n", "DTEND:%s\n" % \
-                                    dtend.strftime("%Y%m%dT%H%M%SZ"), text)
-                            new_items.append(ical.Event(text, item.name))
-
-                else:
-                    if (not start or start < item.dtstart) and \
-                            (not end or end > item.dtstart):
-                        new_items.append(item)
-
-        # Order events by start date
-        if len(new_items) > 0:
-            items = sorted(new_items, key=lambda item: item.dtstart)
+            # Expanded events are ordered by start date
+            with metrics.phase("expand"):
+                items = recurrence.expand(
+                    items, expand[0], expand[1],
+                    known=timezones.tzinfos(calendar.timezones))
+        elif limit_recurrence_set:
+            with metrics.phase("expand"):
+                items = recurrence.expand(
+                    items, limit_recurrence_set[0], limit_recurrence_set[1],
+                    True, timezones.tzinfos(calendar.timezones))
 
         for item in items:
             response = ET.Element(_tag("D", "response"))
@@ -512,7 +529,8 @@ def report(path, xml_request, calendar):
                 elif tag == _tag("C", "calendar-data"):
                     if isinstance(item, (ical.Event, ical.Todo, ical.Journal)):
                         element.text = ical.serialize(
-                            calendar.headers, calendar.timezones + [item])
+                            calendar.headers, timezones.used(
+                                calendar.timezones, (item,)) + [item])
                 prop.append(element)
 
             status = ET.Element(_tag("D", "status"))
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Radicale Server - Calendar Server
+# Copyright © 2011 Guillaume Ayoub
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Radicale tests.
+
+Run them with ``python -m unittest discover tests``.
+
+"""
+
+import io
+import shutil
+import tempfile
+import unittest
+
+import radicale
+from radicale import ical
+
+
+class ApplicationTest(unittest.TestCase):
+    """Tests calling an application storing calendars in a temporary folder."""
+
+    def setUp(self):
+        self.folder = ical.FOLDER
+        ical.FOLDER = tempfile.mkdtemp()
+        self.application = radicale.Application()
+
+    def tearDown(self):
+        shutil.rmtree(ical.FOLDER)
+        ical.FOLDER = self.folder
+
+    def request(self, method, path, body="", **headers):
+        """Call the application, return its status, headers and answer."""
+        body = body.encode("utf-8")
+        environ = {
+            "REQUEST_METHOD": method, "PATH_INFO": path,
+            "CONTENT_LENGTH": str(len(body)), "wsgi.input": io.BytesIO(body)}
+        for key, value in headers.items():
+            environ["HTTP_%s" % key.upper()] = value
+        answer = {}
+
+        def start_response(status, headers, exc_info=None):
+            """Store the status and the headers of the answer."""
+            answer["status"] = int(status.split()[0])
+            answer["headers"] = dict(headers)
+
+        content = b"".join(self.application(environ, start_response))
+        return answer["status"], answer["headers"], content.decode("utf-8")
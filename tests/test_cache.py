@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Radicale Server - Calendar Server
+# Copyright © 2011 Guillaume Ayoub
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Tests of the request caches.
+
+"""
+
+import os
+import threading
+import time
+import unittest
+
+from radicale import cache, ical
+
+from tests import ApplicationTest
+
+
+EVENT = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:test
+BEGIN:VEVENT
+UID:%s
+DTSTART:20111017T180000Z
+DTEND:20111017T190000Z
+SUMMARY:Event
+END:VEVENT
+END:VCALENDAR
+"""
+
+PROPFIND = """<?xml version="1.0" encoding="utf-8"?>
+<D:propfind xmlns:D="DAV:"><D:prop><D:getetag/></D:prop></D:propfind>
+"""
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Concurrent calls with the same key."""
+
+    def setUp(self):
+        self.flights = cache.SingleFlight("test")
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = []
+
+    def _function(self, value):
+        """Return ``value`` once released, raise it if it is an exception."""
+        self.calls.append(value)
+        self.started.set()
+        self.release.wait(5)
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    def _run(self, key, value, results):
+        """Run the function in a thread, append its result to ``results``."""
+        def run():
+            try:
+                results.append(self.flights.run(key, self._function, value))
+            except Exception as exception:
+                results.append(exception)
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def _wait(self, threads):
+        """Release the function and wait for the end of ``threads``."""
+        # Let the waiting threads reach the running call
+        time.sleep(0.1)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+
+    def test_coalesce(self):
+        results = []
+        threads = [self._run("key", "first", results)]
+        self.started.wait(5)
+        threads.extend(self._run("key", "second", results) for _ in range(3))
+        self._wait(threads)
+        self.assertEqual(self.calls, ["first"])
+        self.assertEqual(results, ["first"] * 4)
+
+    def test_error(self):
+        error = ValueError("error")
+        results = []
+        threads = [self._run("key", error, results)]
+        self.started.wait(5)
+        threads.append(self._run("key", "second", results))
+        self._wait(threads)
+        self.assertEqual(self.calls, [error])
+        self.assertEqual(results, [error, error])
+
+    def test_keys(self):
+        self.release.set()
+        self.assertEqual(self.flights.run("key", self._function, 1), 1)
+        self.assertEqual(self.flights.run("key", self._function, 2), 2)
+        self.assertEqual(self.flights.run("other", self._function, 3), 3)
+        self.assertEqual(self.calls, [1, 2, 3])
+
+
+class TestResponseCache(unittest.TestCase):
+    """Answers kept in memory."""
+
+    def setUp(self):
+        self.responses = cache.ResponseCache("test", 10)
+
+    def test_lru(self):
+        self.responses.set("first", 1, 4)
+        self.responses.set("second", 2, 4)
+        self.assertEqual(self.responses.get("first"), 1)
+        # The least recently used answer is removed
+        self.responses.set("third", 3, 4)
+        self.assertIsNone(self.responses.get("second"))
+        self.assertEqual(self.responses.get("first"), 1)
+        self.assertEqual(self.responses.get("third"), 3)
+
+    def test_replace(self):
+        self.responses.set("key", 1, 8)
+        self.responses.set("key", 2, 8)
+        self.assertEqual(self.responses.get("key"), 2)
+
+    def test_too_large(self):
+        self.responses.set("key", 1, 11)
+        self.assertIsNone(self.responses.get("key"))
+
+    def test_discard(self):
+        self.responses.set("first", 1, 1, ["calendar"])
+        self.responses.set("second", 2, 1, ["calendar", "other"])
+        self.responses.set("third", 3, 1, ["other"])
+        self.responses.discard("calendar")
+        self.assertIsNone(self.responses.get("first"))
+        self.assertIsNone(self.responses.get("second"))
+        self.assertEqual(self.responses.get("third"), 3)
+        # Sizes of the removed answers are released
+        self.responses.set("fourth", 4, 9)
+        self.assertEqual(self.responses.get("fourth"), 4)
+
+
+class TestInvalidation(ApplicationTest):
+    """Cached calendars and answers of modified calendars."""
+
+    def _etags(self):
+        """Return the PROPFIND answer on the calendar."""
+        status, _, answer = self.request(
+            "PROPFIND", "/user/calendar/", PROPFIND, depth="1")
+        self.assertEqual(status, 207)
+        return answer
+
+    def test_same_size(self):
+        self.request("PUT", "/user/calendar/first.ics", EVENT % "first")
+        calendar = ical.Calendar("user/calendar")
+        item = calendar.get_item("first.ics")
+        self.assertEqual(item.get("SUMMARY"), "Event")
+
+        # The file is rewritten in place with the same size
+        with open(calendar.path) as stream:
+            text = stream.read()
+        with open(calendar.path, "w") as stream:
+            stream.write(text.replace("SUMMARY:Event", "SUMMARY:Other"))
+        item = calendar.get_item("first.ics")
+        self.assertEqual(item.get("SUMMARY"), "Other")
+
+    def test_write(self):
+        self.request("PUT", "/user/calendar/first.ics", EVENT % "first")
+        answer = self._etags()
+        self.assertEqual(self._etags(), answer)
+        self.request("PUT", "/user/calendar/second.ics", EVENT % "second")
+        self.assertIn("second.ics", self._etags())
+        self.request("DELETE", "/user/calendar/second.ics")
+        self.assertNotIn("second.ics", self._etags())
+
+    def test_same_version(self):
+        # Files may keep the same version on file systems with coarse times
+        file_version = ical._file_version
+        ical._file_version = lambda path: (
+            (0, 0, 0, 0) if os.path.exists(path) else None)
+        try:
+            self.request("PUT", "/user/calendar/first.ics", EVENT % "first")
+            self.assertNotIn("second.ics", self._etags())
+            self.request(
+                "PUT", "/user/calendar/second.ics", EVENT % "second")
+            self.assertIn("second.ics", self._etags())
+        finally:
+            ical._file_version = file_version
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Radicale Server - Calendar Server
+# Copyright © 2011 Guillaume Ayoub
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Tests of the items stored by PUT requests.
+
+"""
+
+from radicale import ical
+
+from tests import ApplicationTest
+
+
+CALENDAR = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:test
+%s
+END:VCALENDAR
+"""
+
+EVENT = """BEGIN:VEVENT
+DTSTART:20111017T180000Z
+DTEND:20111017T190000Z
+SUMMARY:Event
+END:VEVENT"""
+
+TIMEZONE = """BEGIN:VTIMEZONE
+TZID:Europe/Madrid
+BEGIN:STANDARD
+DTSTART:19701025T030000
+TZOFFSETFROM:+0200
+TZOFFSETTO:+0100
+END:STANDARD
+END:VTIMEZONE"""
+
+
+class TestPut(ApplicationTest):
+    """Items put without UID."""
+
+    def test_without_uid(self):
+        status, headers, _ = self.request(
+            "PUT", "/user/calendar/event.ics", CALENDAR % EVENT)
+        self.assertEqual(status, 201)
+        item = ical.Calendar("user/calendar").get_item("event.ics")
+        self.assertEqual(headers["ETag"], item.etag)
+        self.assertIsNotNone(item.get("UID"))
+
+        # The stored item is found again, with the same ETag
+        status, headers, answer = self.request(
+            "GET", "/user/calendar/event.ics")
+        self.assertEqual(status, 200)
+        self.assertEqual(headers["ETag"], item.etag)
+        self.assertIn("SUMMARY:Event", answer)
+
+    def test_timezone(self):
+        status, _, _ = self.request(
+            "PUT", "/user/calendar/event.ics",
+            CALENDAR % ("%s\n%s" % (TIMEZONE, EVENT)))
+        self.assertEqual(status, 201)
+        calendar = ical.Calendar("user/calendar")
+        self.assertEqual(
+            [timezone.name for timezone in calendar.timezones],
+            ["Europe/Madrid"])
+        # Timezones get no UID
+        self.assertEqual(calendar.text.count("UID:"), 1)
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Radicale Server - Calendar Server
+# Copyright © 2011 Guillaume Ayoub
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Tests of the pool of LDAP connections.
+
+A fake ``ldap`` module is used, no LDAP server is needed.
+
+"""
+
+import sys
+import threading
+import time
+import types
+import unittest
+
+
+class LDAPError(Exception):
+    """Fake ``ldap.LDAPError``."""
+
+
+class SERVER_DOWN(LDAPError):  # pylint: disable=C0103
+    """Fake ``ldap.SERVER_DOWN``."""
+
+
+class TIMEOUT(LDAPError):  # pylint: disable=C0103
+    """Fake ``ldap.TIMEOUT``."""
+
+
+class CONNECT_ERROR(LDAPError):  # pylint: disable=C0103
+    """Fake ``ldap.CONNECT_ERROR``."""
+
+
+class BUSY(LDAPError):  # pylint: disable=C0103
+    """Fake ``ldap.BUSY``."""
+
+
+class UNAVAILABLE(LDAPError):  # pylint: disable=C0103
+    """Fake ``ldap.UNAVAILABLE``."""
+
+
+class NO_SUCH_OBJECT(LDAPError):  # pylint: disable=C0103
+    """Fake ``ldap.NO_SUCH_OBJECT``."""
+
+
+class INVALID_CREDENTIALS(LDAPError):  # pylint: disable=C0103
+    """Fake ``ldap.INVALID_CREDENTIALS``."""
+
+
+class Connection(object):
+    """Fake LDAP connection, broken when ``down`` is set."""
+    def __init__(self):
+        self.down = False
+        self.closed = False
+
+    def set_option(self, option, value):
+        """Ignore options."""
+
+    def _check(self):
+        """Raise ``SERVER_DOWN`` if the connection is broken."""
+        if self.down:
+            raise SERVER_DOWN("Can't contact LDAP server")
+
+    def whoami_s(self):
+        """Return the identity of the connection."""
+        self._check()
+        return ""
+
+    def search_s(self, base, scope, query):
+        """Return the users found."""
+        self._check()
+        if query == "uid=missing":
+            raise NO_SUCH_OBJECT(query)
+        return [("%s,%s" % (query, base), {})]
+
+    def simple_bind_s(self, name, password):
+        """Bind as ``name``, only ``secret`` is a valid password."""
+        self._check()
+        if password != "secret":
+            raise INVALID_CREDENTIALS(name)
+
+    def unbind_s(self):
+        """Close the connection."""
+        self.closed = True
+
+
+def _fake_ldap():
+    """Return a fake ``ldap`` module."""
+    module = types.ModuleType("ldap")
+    for error in (LDAPError, SERVER_DOWN, TIMEOUT, CONNECT_ERROR, BUSY,
+                  UNAVAILABLE, NO_SUCH_OBJECT, INVALID_CREDENTIALS):
+        setattr(module, error.__name__, error)
+    module.OPT_NETWORK_TIMEOUT = module.OPT_TIMEOUT = None
+    module.SCOPE_ONELEVEL = 1
+    module.initialize = lambda url: Connection()
+    module.dn = types.ModuleType("ldap.dn")
+    module.dn.escape_dn_chars = lambda value: value
+    return module
+
+
+sys.modules["ldap"] = _fake_ldap()
+sys.modules["ldap.dn"] = sys.modules["ldap"].dn
+from radicale import acl  # pylint: disable=C0413
+from radicale.acl import LDAP  # pylint: disable=C0413
+
+
+class TestConnectionPool(unittest.TestCase):
+    """Tests of ``LDAP.ConnectionPool``."""
+    def setUp(self):
+        self.created = []
+        self.pool = LDAP.ConnectionPool(1, self._factory)
+
+    def _factory(self):
+        """Create and remember a new connection."""
+        connection = Connection()
+        self.created.append(connection)
+        return connection
+
+    def _idle(self):
+        """Return the idle connections of the pool."""
+        return [connection for connection, _ in self.pool._idle]
+
+    def test_reuse(self):
+        """A returned connection is used again."""
+        with self.pool.connection() as first:
+            pass
+        with self.pool.connection() as second:
+            pass
+        self.assertIs(first, second)
+        self.assertEqual(len(self.created), 1)
+        self.assertEqual(self._idle(), [first])
+
+    def test_request_error(self):
+        """A connection raising a request error is returned to the pool."""
+        with self.assertRaises(NO_SUCH_OBJECT):
+            with self.pool.connection() as connection:
+                connection.search_s("dc=test", 1, "uid=missing")
+        self.assertEqual(self._idle(), [connection])
+        self.assertFalse(connection.closed)
+
+    def test_broken_connection(self):
+        """A connection raising a connection error is dropped."""
+        with self.assertRaises(SERVER_DOWN):
+            with self.pool.connection() as connection:
+                connection.down = True
+                connection.whoami_s()
+        self.assertEqual(self._idle(), [])
+        self.assertTrue(connection.closed)
+
+    def test_stale_connection(self):
+        """A dead idle connection is replaced when it is checked."""
+        with self.pool.connection() as dead:
+            pass
+        dead.down = True
+        # Make the connection old enough to be checked
+        self.pool._idle = [(dead, time.time() - LDAP.CHECK_DELAY - 1)]
+        with self.pool.connection() as connection:
+            pass
+        self.assertIsNot(connection, dead)
+        self.assertTrue(dead.closed)
+        self.assertEqual(self._idle(), [connection])
+
+    def test_exhaustion(self):
+        """Checkouts wait for a free connection when the pool is full."""
+        got = threading.Event()
+
+        def checkout():
+            """Get a connection in another thread."""
+            with self.pool.connection():
+                got.set()
+
+        with self.pool.connection():
+            thread = threading.Thread(target=checkout)
+            thread.start()
+            self.assertFalse(got.wait(0.2))
+        thread.join(5)
+        self.assertTrue(got.is_set())
+        self.assertEqual(len(self.created), 1)
+
+
+class TestCall(unittest.TestCase):
+    """Tests of ``LDAP._call``."""
+    def setUp(self):
+        self.created = []
+        self.pool = LDAP.ConnectionPool(2, self._factory)
+
+    def _factory(self):
+        """Create and remember a new connection."""
+        connection = Connection()
+        self.created.append(connection)
+        return connection
+
+    def test_retry(self):
+        """A call on a connection dropped by the server is tried again."""
+        with self.pool.connection() as dead:
+            pass
+        dead.down = True
+        users = LDAP._call(
+            self.pool, "search_s", "dc=test", 1, "uid=user")
+        self.assertEqual(users, [("uid=user,dc=test", {})])
+        self.assertTrue(dead.closed)
+        self.assertEqual(
+            [connection for connection, _ in self.pool._idle],
+            [self.created[1]])
+
+    def test_retry_once(self):
+        """The call fails if the server is still down."""
+        self.pool.factory = lambda: self._down(self._factory())
+        with self.assertRaises(SERVER_DOWN):
+            LDAP._call(self.pool, "search_s", "dc=test", 1, "uid=user")
+        self.assertEqual(len(self.created), 2)
+        self.assertEqual(self.pool._idle, [])
+
+    @staticmethod
+    def _down(connection):
+        """Return ``connection``, broken."""
+        connection.down = True
+        return connection
+
+
+class TestHasRight(unittest.TestCase):
+    """Tests of ``LDAP.has_right``."""
+    def setUp(self):
+        self.down = False
+        self.pools = LDAP.SEARCH_POOL, LDAP.BIND_POOL
+        LDAP.SEARCH_POOL = LDAP.ConnectionPool(1, self._factory)
+        LDAP.BIND_POOL = LDAP.ConnectionPool(1, self._factory)
+
+    def tearDown(self):
+        LDAP.SEARCH_POOL, LDAP.BIND_POOL = self.pools
+
+    def _factory(self):
+        """Create a new connection, broken if the server is down."""
+        connection = Connection()
+        connection.down = self.down
+        return connection
+
+    def test_credentials(self):
+        """Valid credentials are accepted, others are refused."""
+        self.assertTrue(LDAP.has_right("user", "user", "secret"))
+        self.assertFalse(LDAP.has_right("user", "user", "wrong"))
+
+    def test_server_down(self):
+        """Credentials cannot be checked when the server is down."""
+        self.down = True
+        with self.assertRaises(acl.BackendUnavailable):
+            LDAP.has_right("user", "user", "secret")
+
+
+if __name__ == "__main__":
+    unittest.main()
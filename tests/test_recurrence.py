@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Radicale Server - Calendar Server
+# Copyright © 2011 Guillaume Ayoub
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Tests of the expansion of recurring events.
+
+"""
+
+from datetime import datetime
+import unittest
+
+from radicale import ical, recurrence
+
+
+def _items(*components):
+    """Return the event items of a calendar holding ``components``."""
+    text = "BEGIN:VCALENDAR\nVERSION:2.0\nPRODID:test\n%s\nEND:VCALENDAR\n" % (
+        "\n".join(components))
+    return ical.Calendar._parse_items(text, (ical.Event,))
+
+
+def _event(uid, *lines):
+    """Return the text of the ``uid`` event with the properties ``lines``."""
+    return "BEGIN:VEVENT\nUID:%s\n%s\nSUMMARY:%s\nEND:VEVENT" % (
+        uid, "\n".join(lines), uid)
+
+
+def _starts(items):
+    """Return the start dates of ``items``."""
+    return [item.dtstart for item in items]
+
+
+class TestBounds(unittest.TestCase):
+    """Events recurring forever."""
+
+    def setUp(self):
+        self.max_skipped = recurrence.MAX_SKIPPED
+        recurrence.MAX_SKIPPED = 1000
+        self.items = _items(_event(
+            "minutely", "DTSTART:20000101T000000Z", "DTEND:20000101T000030Z",
+            "RRULE:FREQ=MINUTELY"))
+
+    def tearDown(self):
+        recurrence.MAX_SKIPPED = self.max_skipped
+
+    def test_open_range(self):
+        occurrences = recurrence.expand(self.items, None, None)
+        self.assertEqual(len(occurrences), recurrence.MAX_INSTANCES)
+
+    def test_near_range(self):
+        occurrences = recurrence.expand(
+            self.items, datetime(2000, 1, 1, 10), datetime(2000, 1, 1, 10, 3))
+        self.assertEqual(_starts(occurrences), [
+            datetime(2000, 1, 1, 10), datetime(2000, 1, 1, 10, 1),
+            datetime(2000, 1, 1, 10, 2)])
+
+    def test_far_range(self):
+        # Occurrences after MAX_SKIPPED occurrences are not searched
+        start, end = datetime(2012, 1, 1), datetime(2012, 1, 2)
+        self.assertEqual(recurrence.expand(self.items, start, end), [])
+        self.assertEqual(recurrence.select(self.items, start, end), [])
+
+
+class TestInvalid(unittest.TestCase):
+    """Events with invalid recurrences."""
+
+    def test_invalid_rule(self):
+        items = _items(_event(
+            "bogus", "DTSTART:20000101T100000Z", "DTEND:20000101T110000Z",
+            "RRULE:FREQ=BOGUS"))
+        start, end = datetime(2000, 1, 1), datetime(2000, 1, 3)
+        self.assertEqual(recurrence.select(items, start, end), items)
+        self.assertEqual(
+            _starts(recurrence.expand(items, start, end)),
+            [datetime(2000, 1, 1, 10)])
+
+    def test_invalid_exdate(self):
+        items = _items(_event(
+            "bogus", "DTSTART:20000101T100000Z", "DTEND:20000101T110000Z",
+            "RRULE:FREQ=DAILY", "EXDATE:tomorrow"))
+        self.assertEqual(
+            _starts(recurrence.expand(
+                items, datetime(2000, 1, 1), datetime(2000, 1, 3))),
+            [datetime(2000, 1, 1, 10)])
+
+
+class TestRecurrenceSet(unittest.TestCase):
+    """Events with excluded, added and overridden occurrences."""
+
+    def test_exdate(self):
+        items = _items(_event(
+            "daily", "DTSTART:20000101T100000Z", "DTEND:20000101T110000Z",
+            "RRULE:FREQ=DAILY;COUNT=4", "EXDATE:20000102T100000Z"))
+        self.assertEqual(
+            _starts(recurrence.expand(items, None, None)),
+            [datetime(2000, 1, 1, 10), datetime(2000, 1, 3, 10),
+             datetime(2000, 1, 4, 10)])
+        self.assertEqual(recurrence.select(
+            items, datetime(2000, 1, 2), datetime(2000, 1, 3)), [])
+
+    def test_rdate(self):
+        items = _items(_event(
+            "daily", "DTSTART:20000101T100000Z", "DTEND:20000101T110000Z",
+            "RRULE:FREQ=DAILY;COUNT=2", "RDATE:20000110T100000Z"))
+        self.assertEqual(
+            _starts(recurrence.expand(items, datetime(2000, 1, 2), None)),
+            [datetime(2000, 1, 2, 10), datetime(2000, 1, 10, 10)])
+
+    def test_override(self):
+        items = _items(
+            _event(
+                "daily", "DTSTART:20000101T100000Z", "DTEND:20000101T110000Z",
+                "RRULE:FREQ=DAILY;COUNT=3"),
+            _event(
+                "daily", "RECURRENCE-ID:20000102T100000Z",
+                "DTSTART:20000105T100000Z", "DTEND:20000105T110000Z"))
+        self.assertEqual(len(items), 1)
+        occurrences = recurrence.expand(items, None, None)
+        self.assertEqual(
+            _starts(occurrences),
+            [datetime(2000, 1, 1, 10), datetime(2000, 1, 3, 10),
+             datetime(2000, 1, 5, 10)])
+        self.assertEqual(
+            occurrences[2].get("RECURRENCE-ID"), "20000102T100000Z")
+
+        # The moved occurrence is found in its new time range only
+        self.assertEqual(recurrence.select(
+            items, datetime(2000, 1, 2), datetime(2000, 1, 3)), [])
+        self.assertEqual(recurrence.select(
+            items, datetime(2000, 1, 5), datetime(2000, 1, 6)), items)
+
+    def test_limit_recurrence_set(self):
+        items = _items(
+            _event(
+                "daily", "DTSTART:20000101T100000Z", "DTEND:20000101T110000Z",
+                "RRULE:FREQ=DAILY;COUNT=3"),
+            _event(
+                "daily", "RECURRENCE-ID:20000102T100000Z",
+                "DTSTART:20000105T100000Z", "DTEND:20000105T110000Z"))
+        occurrences = recurrence.expand(
+            items, datetime(2000, 1, 5), datetime(2000, 1, 6), True)
+        self.assertEqual(
+            [item.get("RECURRENCE-ID") for item in occurrences],
+            [None, "20000102T100000Z"])
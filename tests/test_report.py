@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Radicale Server - Calendar Server
+# Copyright © 2011 Guillaume Ayoub
+#
+# This library is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Radicale.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Tests of the time ranges of REPORT requests.
+
+"""
+
+from tests import ApplicationTest
+
+
+EVENT = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:test
+BEGIN:VTIMEZONE
+TZID:Europe/Madrid
+BEGIN:STANDARD
+DTSTART:19701025T030000
+RRULE:FREQ=YEARLY;BYDAY=-1SU;BYMONTH=10
+TZOFFSETFROM:+0200
+TZOFFSETTO:+0100
+END:STANDARD
+BEGIN:DAYLIGHT
+DTSTART:19700329T020000
+RRULE:FREQ=YEARLY;BYDAY=-1SU;BYMONTH=3
+TZOFFSETFROM:+0100
+TZOFFSETTO:+0200
+END:DAYLIGHT
+END:VTIMEZONE
+BEGIN:VEVENT
+UID:daily
+DTSTART;TZID=Europe/Madrid:20111027T180000
+DTEND;TZID=Europe/Madrid:20111027T190000
+RRULE:FREQ=DAILY;COUNT=5
+SUMMARY:Daily
+END:VEVENT
+END:VCALENDAR
+"""
+
+QUERY = """<?xml version="1.0" encoding="utf-8"?>
+<C:calendar-query xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
+  <D:prop><C:calendar-data>%s</C:calendar-data></D:prop>
+  <C:filter>
+    <C:comp-filter name="VCALENDAR">
+      <C:comp-filter name="VEVENT">
+        <C:time-range start="%s" end="%s"/>
+      </C:comp-filter>
+    </C:comp-filter>
+  </C:filter>
+</C:calendar-query>
+"""
+
+
+class TestTimeRange(ApplicationTest):
+    """Calendar queries with time ranges."""
+
+    def setUp(self):
+        super(TestTimeRange, self).setUp()
+        status, _, _ = self.request("PUT", "/user/calendar/daily.ics", EVENT)
+        self.assertEqual(status, 201)
+
+    def _report(self, start, end, data=""):
+        """Return the calendar data answered to a query on a time range."""
+        status, _, answer = self.request(
+            "REPORT", "/user/calendar/", QUERY % (data, start, end), depth="1")
+        self.assertEqual(status, 207)
+        return answer
+
+    def test_filter(self):
+        # Occurrences are filtered in UTC: 18:00 is 16:00 UTC before the end
+        # of the daylight saving time, 17:00 UTC after
+        answer = self._report("20111029T160000Z", "20111029T163000Z")
+        self.assertIn("Daily", answer)
+        answer = self._report("20111029T170000Z", "20111029T173000Z")
+        self.assertNotIn("Daily", answer)
+        answer = self._report("20111030T160000Z", "20111030T170000Z")
+        self.assertNotIn("Daily", answer)
+        answer = self._report("20111030T170000Z", "20111030T173000Z")
+        self.assertIn("Daily", answer)
+
+    def test_filter_master(self):
+        # Without expand element, the matching master event is returned
+        answer = self._report("20111029T000000Z", "20111031T000000Z")
+        self.assertEqual(answer.count("BEGIN:VEVENT"), 1)
+        self.assertIn("RRULE:FREQ=DAILY;COUNT=5", answer)
+        self.assertNotIn("RECURRENCE-ID", answer)
+
+    def test_expand(self):
+        # Occurrences are expanded in the range of the expand element
+        answer = self._report(
+            "20111029T000000Z", "20111030T000000Z",
+            '<C:expand start="20111027T000000Z" end="20111030T000000Z"/>')
+        self.assertEqual(answer.count("BEGIN:VEVENT"), 3)
+        self.assertEqual(answer.count("RECURRENCE-ID"), 3)
+        self.assertNotIn("RRULE:FREQ=DAILY", answer)
+
+    def test_expand_filtered(self):
+        # Events not matching the filter are not expanded
+        answer = self._report(
+            "20111101T000000Z", "20111102T000000Z",
+            '<C:expand start="20111027T000000Z" end="20111030T000000Z"/>')
+        self.assertNotIn("BEGIN:VEVENT", answer)